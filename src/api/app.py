@@ -1,6 +1,7 @@
 import os
 import re
 from fastapi import FastAPI, HTTPException, Security, Depends, File, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security.api_key import APIKeyHeader
 from typing import List, Optional
 from pydantic import BaseModel
@@ -19,6 +20,12 @@ _asr_service = ASRService(model_size="base", language="zh")
 _tts_service = TTSService(language="zh", rate=150)
 
 
+def _handle_turn(session_id: str, text: str) -> str:
+    """在工作執行緒中處理一輪對話；同一會話的請求依序執行，避免同時改同一個 session"""
+    with _session_store.lock(session_id):
+        return _dialogue_manager.handle(session_id, text)
+
+
 class TextDialogueRequest(BaseModel):
     """文本對話請求"""
     session_id: str
@@ -83,8 +90,8 @@ async def text_dialogue(request: TextDialogueRequest, api_key: str = Depends(get
           -d '{"session_id": "user123", "text": "我要飯糰"}'
     """
     try:
-        # 調用對話管理器
-        response = _dialogue_manager.handle(request.session_id, request.text)
+        # 調用對話管理器（可能同步呼叫 LLM，放到執行緒池避免卡住事件迴圈）
+        response = await run_in_threadpool(_handle_turn, request.session_id, request.text)
 
         return TextDialogueResponse(
             session_id=request.session_id,
@@ -125,7 +132,7 @@ async def voice_dialogue(
 
         try:
             # 使用 ASR 將語音轉為文字
-            asr_result = _asr_service.transcribe(tmp_path)
+            asr_result = await run_in_threadpool(_asr_service.transcribe, tmp_path)
 
             if asr_result.get("error"):
                 return {
@@ -148,10 +155,10 @@ async def voice_dialogue(
                 }
 
             # 調用對話管理器
-            dialogue_response = _dialogue_manager.handle(session_id, user_text)
+            dialogue_response = await run_in_threadpool(_handle_turn, session_id, user_text)
 
             # 使用 TTS 將回應轉為語音
-            tts_result = _tts_service.speak(dialogue_response)
+            tts_result = await run_in_threadpool(_tts_service.speak, dialogue_response)
 
             return {
                 "session_id": session_id,
@@ -1,5 +1,11 @@
+import copy
+import functools
+import inspect
+import logging
 import re
+import threading
 import uuid
+from collections import OrderedDict, deque
 from datetime import datetime
 from typing import Dict, Any, List, Optional
 
@@ -18,22 +24,171 @@ from src.dm.session_context import SessionContext
 from src.dm.llm_router import LLMRouter
 from src.dm.llm_clarifier import LLMClarifier
 
+logger = logging.getLogger(__name__)
+
 
 RICE_CHOICES_TEXT = "還差米種，你要紫米、白米還是混米？"
 
+# 多品項切分關鍵字（長者優先），合併為單一正則
+_SPLIT_KEYWORDS = tuple(sorted(["、", "，", "跟", "還要", "再來", "再給我", "再一個", "再一份"], key=len, reverse=True))
+_SPLIT_RE = re.compile("|".join(re.escape(kw) for kw in _SPLIT_KEYWORDS))
+
+# 確認/否定/換飲料的關鍵字（只看有沒有出現，順序不影響結果）
+_AFFIRM_RE = re.compile("好|對|確定|是|ok|要")
+_DENY_RE = re.compile("取消|不|改一下|還沒")
+_AGREE_RE = re.compile("可以|沒問題")
+# 清空確認需整句完全符合，避免「不要」之類被當成同意
+_AFFIRM_EXACT = frozenset({"好", "對", "確定", "是", "ok", "是的", "要"})
+_SIZE_CONFIRM_RE = re.compile("中杯|是|對|好|可以|ok")
+_SWAP_RE = re.compile("換|改|不要")
+
+# 「刪除第 N 項」的序號格式，依序嘗試
+_INDEX_PATTERNS = (
+    re.compile(r"第\s*(\d+|[一二三四五六七八九十]+)\s*(?:項|個|份)?"),
+    re.compile(r"(\d+|[一二三四五六七八九十]+)\s*(?:項|個|份)"),
+)
+
+# 補槽時視為「沒有值」的結果；False / 0 是有效值，不能用真值判斷
+_EMPTY_SLOT_VALUES = ([], {}, "")
+
+# 計價快取：不影響價格的欄位不列入 key
+_PRICE_CACHE_SIZE = 1024
+_PRICE_KEY_IGNORED = frozenset({"raw_text", "missing_slots"})
+
+_DRINK_SIZE_RE = re.compile(r"\((中|大)\)")
+
+
+@functools.lru_cache(maxsize=256)
+def _extract_size(name: str) -> str:
+    """從飲品正式名稱的 (中)/(大) 標記取得杯型，預設中杯"""
+    m = _DRINK_SIZE_RE.search(name)
+    return "大杯" if m and m.group(1) == "大" else "中杯"
+
+
+# 飲品正式名稱轉顯示名稱：去掉 精選/有糖/無糖，(中)/(大) 改寫為杯型
+_DRINK_DISPLAY_RE = re.compile(r"精選|有糖|無糖|\(中\)|\(大\)")
+_DRINK_DISPLAY_MAP = {"(中)": "中杯", "(大)": "大杯"}
+
+
+def _display_drink_name(name: str) -> str:
+    return _DRINK_DISPLAY_RE.sub(lambda m: _DRINK_DISPLAY_MAP.get(m.group(0), ""), name)
+
+
+def _freeze(value: Any) -> Any:
+    """把 frame 值轉成可雜湊的 tuple，供計價快取當 key"""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, deque)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+# ---- 品項顯示名稱（依 itemtype 分派） ----
+
+def _fmt_drink(frame: Dict[str, Any]) -> str:
+    name = frame.get("drink", "飲料")
+    details = [str(frame[k]) for k in ("size", "temp", "sugar") if frame.get(k)]
+    return f"{name}({', '.join(details)})" if details else name
+
+
+def _fmt_riceball(frame: Dict[str, Any]) -> str:
+    rice, flavor = frame.get("rice"), frame.get("flavor") or "飯糰"
+    return f"{rice}·{flavor}" if rice else flavor
+
+
+def _fmt_carrier(frame: Dict[str, Any]) -> str:
+    return f"{frame.get('flavor', '')}{frame.get('carrier', '餐點')}"
+
+
+def _fmt_egg_pancake(frame: Dict[str, Any]) -> str:
+    return frame.get("flavor", "蛋餅")
+
+
+def _fmt_snack(frame: Dict[str, Any]) -> str:
+    base = frame.get("snack", "點心")
+    details = [v for v in (frame.get("egg_cook"), "不要胡椒" if frame.get("no_pepper") else None) if v]
+    return f"{base}({','.join(details)})" if details else base
+
+
+def _fmt_jam_toast(frame: Dict[str, Any]) -> str:
+    base = frame.get("jam_toast", "果醬吐司")
+    details = [v for v in ("不烤" if frame.get("no_toast") else None, "切邊" if frame.get("cut_edge") else None) if v]
+    return f"{base}({','.join(details)})" if details else base
+
+
+def _fmt_combo(frame: Dict[str, Any]) -> str:
+    return frame.get("combo_name", "套餐")
+
+
+_FORMATTERS = {
+    "drink": _fmt_drink,
+    "riceball": _fmt_riceball,
+    "carrier": _fmt_carrier,
+    "egg_pancake": _fmt_egg_pancake,
+    "snack": _fmt_snack,
+    "jam_toast": _fmt_jam_toast,
+    "combo": _fmt_combo,
+}
+
 
 class _SessionsProxy:
     def __init__(self, store: InMemorySessionStore):
         self._store = store
-
-    def get(self, session_id: str, default: Optional[dict] = None) -> dict:
+        # 建立時判斷一次 store.get 是否必須帶 default，避免每次呼叫都 try/except
         try:
-            return self._store.get(session_id)
+            inspect.signature(store.get).bind("session_id")
+            self._needs_default = False
         except TypeError:
+            self._needs_default = True
+        except ValueError:
+            self._needs_default = False
+
+    def get(self, session_id: str, default: Optional[dict] = None) -> dict:
+        if self._needs_default:
             return self._store.get(session_id, default)
+        return self._store.get(session_id)
 
 
 class DialogueManager:
+    # 各品項必填槽位（依追問順序）
+    _REQUIRED_SLOTS = {
+        "riceball": ("flavor", "rice"),
+        "drink": ("drink", "temp", "size"),
+        "carrier": ("carrier", "flavor"),
+        "egg_pancake": ("flavor",),
+        "snack": ("snack",),
+    }
+    # 品項 -> (工具, 解析方法名)；jam_toast 需檢查錯誤狀態，另行處理
+    _PARSERS = {
+        "riceball": (riceball_tool, "parse_riceball_utterance"),
+        "carrier": (carrier_tool, "parse_carrier_utterance"),
+        "drink": (drink_tool, "parse_drink_utterance"),
+        "snack": (snack_tool, "parse_snack_utterance"),
+        "egg_pancake": (egg_pancake_tool, "parse_egg_pancake_utterance"),
+    }
+    # 品項 -> (工具, 計價方法名)；飯糰的計價參數不同，另外處理
+    _QUOTERS = {
+        "egg_pancake": (egg_pancake_tool, "quote_egg_pancake_price"),
+        "carrier": (carrier_tool, "quote_carrier_price"),
+        "drink": (drink_tool, "quote_drink_price"),
+        "snack": (snack_tool, "quote_snack_price"),
+        "jam_toast": (jam_toast_tool, "quote_jam_toast_price"),
+        "combo": (combo_tool, "quote_combo_price"),
+    }
+    # (品項, 缺少槽位) -> 追問句；槽位為 None 表示該品項的預設追問
+    _CLARIFY_MSGS = {
+        ("drink", "temp"): "你要冰的、溫的？",
+        ("drink", "size"): "大杯還中杯？",
+        ("drink", None): "請問要什麼飲料？",
+        ("riceball", "rice"): RICE_CHOICES_TEXT,
+        ("riceball", "flavor"): "想要哪個口味的飯糰？",
+        ("carrier", "carrier"): "你要漢堡、吐司還是饅頭？",
+        ("carrier", "flavor"): "請問要什麼口味？",
+        ("jam_toast", "flavor"): "請問要什麼口味的果醬吐司？",
+        ("jam_toast", "size"): "要厚片還是薄片呢？",
+        ("egg_pancake", "flavor"): "請問要什麼口味的蛋餅？",
+    }
+
     def __init__(
         self,
         llm: Any = None,
@@ -48,23 +203,21 @@ class DialogueManager:
         self.sessions = _SessionsProxy(self.store)
         self.llm_router = llm_router if llm_enabled else None
         self.llm_clarifier = llm_clarifier if llm_enabled else None
-        self.split_keywords = sorted(["、", "，", "跟", "還要", "再來", "再給我", "再一個", "再一份"], key=len, reverse=True)
+        self._price_cache: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self._price_cache_lock = threading.Lock()  # handle 可能在工作執行緒中並行執行
+        self.split_keywords = _SPLIT_KEYWORDS
 
     def _split_utterance(self, text: str) -> List[str]:
         if not text: return []
-        sep = "|||"
-        t = text
-        for kw in self.split_keywords:
-            t = t.replace(kw, sep)
-        return [s.strip() for s in t.split(sep) if s.strip()]
+        return [s for s in (p.strip() for p in _SPLIT_RE.split(text)) if s]
 
     def handle(self, session_id: str, text: str) -> str:
-        # 追蹤當前會話 ID，供 get_clarify_message 使用
-        self._last_session_id = session_id
         session = self.store.get(session_id)
         self._ensure_session_defaults(session)
-        session["last_user_text"] = text.strip()
-        session["history"].append(text.strip())
+        pending_frames = session["pending_frames"]
+        stripped = text.strip()
+        session["last_user_text"] = stripped
+        session["history"].append(stripped)
 
         # 0. 訂單凍結檢查
         if session["status"] == "SUBMITTED":
@@ -72,18 +225,17 @@ class DialogueManager:
 
         # 1. 結帳確認狀態處理
         if session["status"] == "CONFIRMING_CHECKOUT":
-            if any(kw in text for kw in ["好", "對", "確定", "是", "ok", "要", "是的"]):
+            if _AFFIRM_RE.search(text):
                 return self._submit_order(session)
-            elif any(kw in text for kw in ["取消", "不", "不要", "改一下", "還沒"]):
+            elif _DENY_RE.search(text):
                 session["status"] = "OPEN"
                 return "好的，訂單尚未送出。請問還需要什麼嗎？"
 
         # 2. 清空確認狀態處理
         if session.get("pending_clear_confirm"):
-            affirmative = ["好", "對", "確定", "是", "ok", "是的", "要"]
-            if any(text.strip() == kw for kw in affirmative) or any(kw in text for kw in ["可以", "沒問題"]):
+            if stripped in _AFFIRM_EXACT or _AGREE_RE.search(text):
                 session["cart"] = []
-                session["pending_frames"] = []
+                session["pending_frames"] = deque()
                 session.pop("current_combo_frame", None)
                 session.pop("pending_clear_confirm", None)
                 session["status"] = "OPEN"
@@ -92,15 +244,22 @@ class DialogueManager:
                 session.pop("pending_clear_confirm", None)
                 return "好的，已為您保留訂單。請問還需要什麼嗎？"
 
-        # 3. 路由判斷
+        # 3. 空白輸入：有待補品項時重問，否則直接提示點餐（不進路由與解析）
+        if not stripped:
+            if pending_frames:
+                first = pending_frames[0]
+                return self.get_clarify_message(first.get("itemtype", "unknown"), first.get("missing_slots", []), first, session)
+            return "請問要點什麼？"
+
+        # 4. 路由判斷
         route_res = order_router.route(text, current_order_has_main=bool(session["cart"]))
         rtype = route_res["route_type"]
 
-        # 4. 結帳/編輯功能路由
+        # 5. 結帳/編輯功能路由
         if rtype == "checkout":
-            if session["pending_frames"]:
-                first = session["pending_frames"][0]
-                return self.get_clarify_message(first.get("itemtype", "unknown"), first.get("missing_slots", []), first)
+            if pending_frames:
+                first = pending_frames[0]
+                return self.get_clarify_message(first.get("itemtype", "unknown"), first.get("missing_slots", []), first, session)
             if not session["cart"]:
                 return "您的購物車是空的，請先點餐喔！"
             
@@ -118,23 +277,24 @@ class DialogueManager:
         if rtype == "cancel_generic":
             return self._handle_cancel_generic(session)
 
-        # 5. 既有補槽流程
-        if session["pending_frames"]:
+        # 6. 既有補槽流程
+        if pending_frames:
             return self._process_pending_frames(session_id, session, text)
 
-        # 6. 新訂單解析
+        # 7. 新訂單解析
         return self._process_new_order(session_id, session, text)
         
     def _submit_order(self, session: Dict[str, Any]) -> str:
         """生成 Payload 並送出訂單"""
         order_id = f"SN-{datetime.now().strftime('%m%d')}-{str(uuid.uuid4())[:4].upper()}"
-        total_price = self._calculate_cart_total(session)
-        
-        items_payload = []
+        # 一次走訪購物車，同時累計總價（與 _calculate_cart_total 相同：只計成功計價的品項）
+        items_payload, total_price = [], 0
         for item in session["cart"]:
             qty = int(item.get("quantity", 1) or 1)
             pi = self._get_price_info(item)
             item_total = self._extract_total_from_pi(pi, qty)
+            if pi and pi.get("status") == "success":
+                total_price += item_total
             unit_price = item_total // qty if qty > 0 else 0
             
             items_payload.append({
@@ -181,11 +341,15 @@ class DialogueManager:
         return f"目前只有 {len(cart)} 項品項，請確認要刪除第幾項。"
 
     def _handle_cancel_generic(self, session: Dict[str, Any]) -> str:
-        if session["pending_frames"]:
-            removed = session["pending_frames"].pop(0)
+        pending_frames = session["pending_frames"]
+        if pending_frames:
+            removed = pending_frames.popleft()
             if removed.get("_is_combo_sub_item"):
                 session.pop("current_combo_frame", None)
-                session["pending_frames"] = [f for f in session["pending_frames"] if not f.get("_is_combo_sub_item")]
+                # 原地輪轉一次，剔除同套餐的其他子品項
+                for _ in range(len(pending_frames)):
+                    frame = pending_frames.popleft()
+                    if not frame.get("_is_combo_sub_item"): pending_frames.append(frame)
             return "好的，已取消剛剛的變更或品項。還需要什麼嗎？"
         if session.get("pending_clear_confirm"):
             session.pop("pending_clear_confirm")
@@ -193,9 +357,8 @@ class DialogueManager:
         return self._handle_cancel_last(session)
 
     def _parse_index(self, text: str) -> Optional[int]:
-        patterns = [r"第\s*(\d+|[一二三四五六七八九十]+)\s*(?:項|個|份)?", r"(\d+|[一二三四五六七八九十]+)\s*(?:項|個|份)"]
-        for p in patterns:
-            m = re.search(p, text)
+        for p in _INDEX_PATTERNS:
+            m = p.search(text)
             if m:
                 token = m.group(1)
                 return int(token) if token.isdigit() else _chinese_number_to_int(token)
@@ -227,47 +390,62 @@ class DialogueManager:
         return 0
 
     def _get_price_info(self, item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        key = tuple((k, _freeze(v)) for k, v in sorted(item.items()) if k not in _PRICE_KEY_IGNORED)
+        with self._price_cache_lock:
+            pi = self._price_cache.get(key)
+        if pi is None:
+            pi = self._quote_price(item)
+            if pi is None: return None
+            with self._price_cache_lock:
+                self._price_cache[key] = pi
+                if len(self._price_cache) > _PRICE_CACHE_SIZE:
+                    self._price_cache.popitem(last=False)
+        # 回傳副本：快取中的報價為所有會話共用，呼叫端（如 get_price 的 details）改動不會污染快取
+        return copy.deepcopy(pi)
+
+    def _quote_price(self, item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         rtype = item.get("itemtype")
-        pi = None
-        if rtype == "riceball": pi = menu_tool.quote_riceball_price(flavor=item.get("flavor"), large=item.get("large", False), heavy=item.get("heavy", False), extra_egg=item.get("extra_egg", False))
-        elif rtype == "egg_pancake": pi = egg_pancake_tool.quote_egg_pancake_price(item)
-        elif rtype == "carrier": pi = carrier_tool.quote_carrier_price(item)
-        elif rtype == "drink": pi = drink_tool.quote_drink_price(item)
-        elif rtype == "snack": pi = snack_tool.quote_snack_price(item)
-        elif rtype == "jam_toast": pi = jam_toast_tool.quote_jam_toast_price(item)
-        elif rtype == "combo": pi = combo_tool.quote_combo_price(item)
-        return pi
+        if rtype == "riceball":
+            return menu_tool.quote_riceball_price(flavor=item.get("flavor"), large=item.get("large", False), heavy=item.get("heavy", False), extra_egg=item.get("extra_egg", False))
+        quoter = self._QUOTERS.get(rtype)
+        if not quoter: return None
+        tool, method = quoter
+        return getattr(tool, method)(item)
 
     def _flush_pending_queue(self, session: Dict[str, Any], newly_completed: List[Dict[str, Any]]) -> Optional[str]:
         clarify_msg = None
-        i = 0
-        while i < len(session["pending_frames"]):
-            frame = session["pending_frames"][i]
+        pending_frames = session["pending_frames"]
+        # 佇列中的套餐子品項數，每移出一個就減一，不必每次重掃佇列
+        subs_left = sum(1 for f in pending_frames if f.get("_is_combo_sub_item"))
+        # 整個佇列輪轉一次：未完成的放回尾端（保持原順序），完成的移出
+        for _ in range(len(pending_frames)):
+            frame = pending_frames.popleft()
             if frame.get("missing_slots"):
+                # 先放回佇列，澄清器看到的上下文才包含這個待補品項
+                pending_frames.append(frame)
                 if clarify_msg is None:
-                    clarify_msg = self.get_clarify_message(frame.get("itemtype", "unknown"), frame["missing_slots"], frame)
-                i += 1
+                    clarify_msg = self.get_clarify_message(frame.get("itemtype", "unknown"), frame["missing_slots"], frame, session)
                 continue
+            if frame.get("_is_combo_sub_item"): subs_left -= 1
             if frame.get("_is_combo_sub_item") and session.get("current_combo_frame"):
-                sub_item = session["pending_frames"].pop(i)
-                session["current_combo_frame"]["sub_items"].append(sub_item)
-                if not any(f.get("_is_combo_sub_item") for f in session["pending_frames"]):
+                session["current_combo_frame"]["sub_items"].append(frame)
+                if not subs_left:
                     completed = session.pop("current_combo_frame")
                     completed["itemtype"] = "combo"
                     session["cart"].append(completed)
                     newly_completed.append(completed)
             else:
-                completed = session["pending_frames"].pop(i)
-                session["cart"].append(completed)
-                newly_completed.append(completed)
+                session["cart"].append(frame)
+                newly_completed.append(frame)
         return clarify_msg
 
     def _process_pending_frames(self, session_id: str, session: Dict[str, Any], text: str) -> str:
-        pending = session["pending_frames"][0]
+        pending_frames = session["pending_frames"]
+        pending = pending_frames[0]
         rtype = pending.get("itemtype", "unknown")
         prefix = ""
         if pending.get("_price_driven_confirm"):
-            if any(kw in text for kw in ["中杯", "是", "對", "好", "可以", "ok"]):
+            if _SIZE_CONFIRM_RE.search(text):
                 pending["size"] = pending.get("_price_driven_chosen_size", "中杯")
                 pending.pop("_price_driven_confirm")
                 pending["missing_slots"] = self._recompute_missing_slots(rtype, pending)
@@ -280,11 +458,12 @@ class DialogueManager:
         res = self._call_tool(rtype, text)
         if res.get("error"): return res["error"]
         frame = res.get("frame", {})
-        for k, v in frame.items():
-            if v is not None and v not in [[], {}, ""]: pending[k] = v
+        pending.update({k: v for k, v in frame.items() if v is not None and v not in _EMPTY_SLOT_VALUES})
         if rtype == "carrier" and pending.get("carrier") and not pending.get("flavor"):
-            matching = [f for f in carrier_tool.flavors_by_carrier.get(pending["carrier"], []) if text.strip() in f]
-            if matching: pending["flavor"] = sorted(matching, key=len)[0]
+            # 口味已依長度排序，第一個包含輸入的就是最短的候選
+            t = text.strip()
+            flavor = next((f for f in carrier_tool.flavors_shortest_first.get(pending["carrier"], ()) if t in f), None)
+            if flavor: pending["flavor"] = flavor
         pending["raw_text"] = text
         pending["missing_slots"] = self._recompute_missing_slots(rtype, pending)
         if pending.get("_is_combo_sub_item") and rtype == "drink" and session.get("current_combo_frame"):
@@ -293,12 +472,12 @@ class DialogueManager:
         msg = self._flush_pending_queue(session, newly_done)
         if msg: return prefix + msg
         if newly_done:
-            summary = "、".join([f"{i.get('quantity', 1)}份 {self._format_item(i)}" for i in newly_done])
+            summary = self._format_done(newly_done)
             return f"好的，{summary}，還需要什麼嗎？"
         return prefix + "請問還需要什麼嗎？"
 
     def _handle_drink_swap(self, span: str, session: Dict[str, Any], parsed_frames: List[Dict[str, Any]]) -> bool:
-        if not any(kw in span for kw in ["換", "改", "改成", "不要"]): return False
+        if not _SWAP_RE.search(span): return False
         dr = drink_tool.parse_drink_utterance(span)
         if not dr.get("drink"): return False
         target = next((f for f in parsed_frames if f.get("_is_combo_sub_item") and f.get("itemtype") == "drink"), None)
@@ -313,15 +492,14 @@ class DialogueManager:
                 candidates = combo_tool.resolve_swap_drink_candidates(dr["drink"])
                 chosen_can, delta, needs_confirm = combo_tool.choose_default_by_price(candidates, p_old)
                 if chosen_can and needs_confirm:
-                    chosen_size = "中杯" if "(中)" in chosen_can else "大杯" if "(大)" in chosen_can else "中杯"
+                    chosen_size = _extract_size(chosen_can)
                     other_candidates = [c for c in candidates if c != chosen_can]
-                    def fmt(name): return name.replace("精選", "").replace("有糖", "").replace("無糖", "").replace("(中)", "中杯").replace("(大)", "大杯")
-                    old_disp, new_disp_base = fmt(old_can), dr["drink"]
+                    old_disp, new_disp_base = _display_drink_name(old_can), dr["drink"]
                     msg = f"原本{old_disp}{p_old}元，{new_disp_base}{chosen_size}也是{p_old}元，確認換{chosen_size}嗎？"
                     if delta > 0: msg = f"原本{old_disp}{p_old}元，{new_disp_base}{chosen_size}需補差價{delta}元，確認換{chosen_size}嗎？"
                     for oc in other_candidates:
                         p_oc = menu_price_service.get_price("飲品", oc)
-                        oc_size = "中杯" if "(中)" in oc else "大杯" if "(大)" in oc else "中杯"
+                        oc_size = _extract_size(oc)
                         oc_delta = p_oc - p_old
                         if oc_delta > 0: msg += f"要{oc_size}需補差價{oc_delta}元。"
                         else: msg += f"{oc_size}也是{p_oc}元。"
@@ -389,51 +567,37 @@ class DialogueManager:
         msg = self._flush_pending_queue(session, newly_done)
         if msg: return msg
         if newly_done:
-            summary = "、".join([f"{i.get('quantity', 1)}份 {self._format_item(i)}" for i in newly_done])
+            summary = self._format_done(newly_done)
             return f"好的，{summary}，還需要什麼嗎？"
         return "不好意思，我沒有聽懂您的指令，請再說一次。"
         
     def _recompute_missing_slots(self, rtype: str, frame: Dict[str, Any]) -> List[str]:
         if frame.get("_price_driven_confirm"): return ["_price_driven_confirm"]
-        missing = []
-        if rtype == "riceball":
-            if not frame.get("flavor"): missing.append("flavor")
-            if not frame.get("rice"): missing.append("rice")
-        elif rtype == "drink":
-            if not frame.get("drink"): missing.append("drink")
-            if not frame.get("temp"): missing.append("temp")
-            if not frame.get("size"): missing.append("size")
-        elif rtype == "carrier":
-            if not frame.get("carrier"): missing.append("carrier")
-            if not frame.get("flavor"): missing.append("flavor")
-        elif rtype == "jam_toast":
-            if not frame.get("jam_toast") and not frame.get("flavor"): missing.append("flavor")
+        if rtype == "jam_toast":
+            # 果醬吐司：品名或口味擇一即可
+            missing = [] if frame.get("jam_toast") or frame.get("flavor") else ["flavor"]
             if not frame.get("size"): missing.append("size")
-        elif rtype == "egg_pancake":
-            if not frame.get("flavor"): missing.append("flavor")
-        elif rtype == "snack":
-            if not frame.get("snack"): missing.append("snack")
-        return missing
+            return missing
+        return [s for s in self._REQUIRED_SLOTS.get(rtype, ()) if not frame.get(s)]
 
     def _call_tool(self, rtype: str, text: str) -> Dict[str, Any]:
         try:
-            res = None
-            if rtype == "riceball": res = riceball_tool.parse_riceball_utterance(text)
-            elif rtype == "carrier": res = carrier_tool.parse_carrier_utterance(text)
-            elif rtype == "drink": res = drink_tool.parse_drink_utterance(text)
-            elif rtype == "snack": res = snack_tool.parse_snack_utterance(text)
-            elif rtype == "jam_toast": 
-                tmp = jam_toast_tool.parse_jam_toast_utterance(text)
-                if tmp.get("status") == "error": return {"frame": None, "error": tmp.get("message")}
-                res = tmp
-            elif rtype == "egg_pancake": res = egg_pancake_tool.parse_egg_pancake_utterance(text)
-            return {"frame": res}
+            if rtype == "jam_toast":
+                res = jam_toast_tool.parse_jam_toast_utterance(text)
+                if res.get("status") == "error": return {"frame": None, "error": res.get("message")}
+                return {"frame": res}
+            parser = self._PARSERS.get(rtype)
+            if parser is None: return {"frame": None}
+            tool, method = parser
+            return {"frame": getattr(tool, method)(text)}
         except RuntimeError as e:
             if "Failed to load" in str(e): return {"frame": None, "error": "菜單讀取失敗，請洽服務人員。"}
             raise e
-        except Exception: return {"frame": None, "error": "處理您的請求時發生內部錯誤。"}
+        except Exception:
+            logger.exception("Tool error for %s", rtype)
+            return {"frame": None, "error": "處理您的請求時發生內部錯誤。"}
 
-    def get_clarify_message(self, rtype: str, missing: List[str], pending_frame: Optional[Dict[str, Any]] = None) -> str:
+    def get_clarify_message(self, rtype: str, missing: List[str], pending_frame: Optional[Dict[str, Any]] = None, session: Optional[Dict[str, Any]] = None) -> str:
         if not missing: return "請問還需要什麼嗎？"
         f = missing[0]
         if f == "_price_driven_confirm" and pending_frame: return pending_frame.get("_price_driven_msg", "確認換杯型嗎？")
@@ -441,7 +605,7 @@ class DialogueManager:
         # 如果啟用了 LLM 澄清器，嘗試生成自然的問題
         if self.llm_clarifier:
             try:
-                context = SessionContext.from_session(self.sessions.get(getattr(self, '_last_session_id', None), {}))
+                context = SessionContext.from_session(session or {})
                 question = self.llm_clarifier.generate_question(
                     rtype,
                     missing,
@@ -454,42 +618,18 @@ class DialogueManager:
                 pass
 
         # 硬編碼的備選問題（或 LLM 不可用時使用）
-        if rtype == "drink":
-            if f == "temp": return "你要冰的、溫的？"
-            if f == "size": return "大杯還中杯？"
-            return "請問要什麼飲料？"
-        if rtype == "riceball":
-            if f == "rice": return RICE_CHOICES_TEXT
-            if f == "flavor": return "想要哪個口味的飯糰？"
-        if rtype == "carrier":
-            if f == "carrier": return "你要漢堡、吐司還是饅頭？"
-            if f == "flavor": return "請問要什麼口味？"
-        if rtype == "jam_toast":
-            if f == "flavor": return "請問要什麼口味的果醬吐司？"
-            if f == "size": return "要厚片還是薄片呢？"
-        if rtype == "egg_pancake":
-            if f == "flavor": return "請問要什麼口味的蛋餅？"
-        return "請問要補充什麼？"
+        msg = self._CLARIFY_MSGS.get((rtype, f)) or self._CLARIFY_MSGS.get((rtype, None))
+        return msg or "請問要補充什麼？"
+
+    def _format_done(self, items: List[Dict[str, Any]]) -> str:
+        # 單一品項最常見，直接組字串
+        if len(items) == 1:
+            return f"{items[0].get('quantity', 1)}份 {self._format_item(items[0])}"
+        return "、".join([f"{i.get('quantity', 1)}份 {self._format_item(i)}" for i in items])
 
     def _format_item(self, frame: Dict[str, Any]) -> str:
-        rtype = frame.get("itemtype")
-        if rtype == "drink":
-            name = frame.get("drink", "飲料")
-            details = [str(frame[k]) for k in ["size", "temp", "sugar"] if frame.get(k)]
-            return f"{name}({', '.join(details)})" if details else name
-        if rtype == "riceball": return f"{frame.get('rice', '')}{'·' if frame.get('rice') else ''}{frame.get('flavor', '飯糰')}"
-        if rtype == "carrier": return f"{frame.get('flavor', '')}{frame.get('carrier', '餐點')}"
-        if rtype == "egg_pancake": return frame.get('flavor', '蛋餅')
-        if rtype == "snack":
-            base = frame.get('snack', '點心')
-            details = [v for v in [frame.get("egg_cook"), "不要胡椒" if frame.get("no_pepper") else None] if v]
-            return f"{base}({','.join(details)})" if details else base
-        if rtype == "jam_toast":
-            base = frame.get('jam_toast', '果醬吐司')
-            details = [v for v in ["不烤" if frame.get("no_toast") else None, "切邊" if frame.get("cut_edge") else None] if v]
-            return f"{base}({','.join(details)})" if details else base
-        if rtype == "combo": return frame.get("combo_name", "套餐")
-        return "未知品項"
+        formatter = _FORMATTERS.get(frame.get("itemtype"))
+        return formatter(frame) if formatter else "未知品項"
 
     def get_order_summary(self, session_id: str) -> str:
         session = self.sessions.get(session_id, {})
@@ -497,16 +637,18 @@ class DialogueManager:
         if not cart: return "目前沒有品項"
         items, total = [], 0
         for item in cart:
-            qty = int(item.get("quantity", 1) or 1)
+            name = self._format_item(item)
             pi = self._get_price_info(item)
-            if pi and pi.get("status") == "success":
-                total += self._extract_total_from_pi(pi, qty)
-                items.append(self._format_item(item))
-            else: return f"品項「{self._format_item(item)}」無法計價：{pi.get('message', '計價失敗') if pi else '計價失敗'}。請洽服務人員再結帳。"
+            if not pi or pi.get("status") != "success":
+                return f"品項「{name}」無法計價：{pi.get('message', '計價失敗') if pi else '計價失敗'}。請洽服務人員再結帳。"
+            total += self._extract_total_from_pi(pi, int(item.get("quantity", 1) or 1))
+            items.append(name)
         return f"這樣一共{', '.join(items)}，共 {len(cart)} 個品項，共 {total}元"
 
     def _ensure_session_defaults(self, session: Dict[str, Any]) -> None:
         session.setdefault("cart", [])
-        session.setdefault("pending_frames", [])
+        pending_frames = session.get("pending_frames")
+        if not isinstance(pending_frames, deque):
+            session["pending_frames"] = deque(pending_frames or [])
         session.setdefault("history", [])
         session.setdefault("status", "OPEN")
\ No newline at end of file
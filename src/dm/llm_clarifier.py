@@ -1,44 +1,53 @@
 """LLM 驅動的澄清問題生成 - 生成自然的補槽問題"""
 import logging
+import threading
+from collections import OrderedDict
 from typing import Dict, Any, List, Optional
 from src.services.llm_tool_caller import LLMToolCaller
 from src.dm.session_context import SessionContext
 
 logger = logging.getLogger(__name__)
 
+_CACHE_SIZE = 256
+# 每輪都會變、但不影響該問什麼的欄位，不列入快取 key
+_VOLATILE_SLOTS = frozenset({"raw_text", "missing_slots"})
+
 
 class LLMClarifier:
     """使用 LLM 生成上下文感知的澄清問題"""
 
+    # 硬編碼的備選問題（如 LLM 失敗時使用），所有實例共用
+    _hardcoded_questions = {
+        "riceball": {
+            "flavor": "想要哪個口味的飯糰？",
+            "rice": "還差米種，你要紫米、白米還是混米？",
+        },
+        "drink": {
+            "drink": "請問要什麼飲料？",
+            "temp": "你要冰的、溫的？",
+            "size": "大杯還中杯？",
+        },
+        "carrier": {
+            "carrier": "你要漢堡、吐司還是饅頭？",
+            "flavor": "請問要什麼口味？",
+        },
+        "egg_pancake": {
+            "flavor": "請問要什麼口味的蛋餅？",
+        },
+        "jam_toast": {
+            "flavor": "請問要什麼口味的果醬吐司？",
+            "size": "要厚片還是薄片呢？",
+        },
+        "snack": {
+            "snack": "請問要什麼點心？",
+        },
+    }
+
     def __init__(self, llm: LLMToolCaller):
         self.llm = llm
-        # 硬編碼的備選問題（如 LLM 失敗時使用）
-        self._hardcoded_questions = {
-            "riceball": {
-                "flavor": "想要哪個口味的飯糰？",
-                "rice": "還差米種，你要紫米、白米還是混米？",
-            },
-            "drink": {
-                "drink": "請問要什麼飲料？",
-                "temp": "你要冰的、溫的？",
-                "size": "大杯還中杯？",
-            },
-            "carrier": {
-                "carrier": "你要漢堡、吐司還是饅頭？",
-                "flavor": "請問要什麼口味？",
-            },
-            "egg_pancake": {
-                "flavor": "請問要什麼口味的蛋餅？",
-            },
-            "jam_toast": {
-                "flavor": "請問要什麼口味的果醬吐司？",
-                "size": "要厚片還是薄片呢？",
-            },
-            "snack": {
-                "snack": "請問要什麼點心？",
-            },
-        }
-        self._cache: Dict[str, str] = {}
+        # 問題快取（LRU），避免 key 擴充後無限成長
+        self._cache: "OrderedDict[tuple, str]" = OrderedDict()
+        self._cache_lock = threading.Lock()  # 澄清可能在工作執行緒中並行執行
 
     def generate_question(
         self,
@@ -66,9 +75,12 @@ class LLMClarifier:
         slot = missing_slots[0]
 
         # 檢查快取
-        cache_key = f"{itemtype}|{slot}"
-        if cache_key in self._cache:
-            return self._cache[cache_key]
+        cache_key = self._cache_key(itemtype, slot, pending_frame, session_context)
+        with self._cache_lock:
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                self._cache.move_to_end(cache_key)
+                return cached
 
         try:
             # 嘗試使用 LLM 生成問題
@@ -79,7 +91,10 @@ class LLMClarifier:
             question = self._get_hardcoded_question(itemtype, slot)
 
         # 快取結果
-        self._cache[cache_key] = question
+        with self._cache_lock:
+            self._cache[cache_key] = question
+            if len(self._cache) > _CACHE_SIZE:
+                self._cache.popitem(last=False)
         return question
 
     def _generate_with_llm(
@@ -141,6 +156,21 @@ class LLMClarifier:
         # 如果無法提取，備選至硬編碼
         return self._get_hardcoded_question(itemtype, slot)
 
+    def _cache_key(
+        self,
+        itemtype: str,
+        slot: str,
+        pending_frame: Optional[Dict[str, Any]],
+        session_context: Optional[SessionContext],
+    ) -> tuple:
+        """快取 key：品項、缺少槽位，加上會寫進 prompt 的已知槽位與會話上下文"""
+        filled = tuple(sorted(
+            (k, str(v)) for k, v in (pending_frame or {}).items()
+            if v and not k.startswith("_") and k not in _VOLATILE_SLOTS
+        ))
+        context = session_context.signature() if session_context else None
+        return (itemtype, slot, filled, context)
+
     def _get_hardcoded_question(self, itemtype: str, slot: str) -> str:
         """獲取硬編碼的備選問題"""
         questions = self._hardcoded_questions.get(itemtype, {})
@@ -160,4 +190,5 @@ class LLMClarifier:
 
     def clear_cache(self):
         """清除快取"""
-        self._cache.clear()
+        with self._cache_lock:
+            self._cache.clear()
@@ -1,4 +1,5 @@
 """LLM 對話處理器 - 主要的 LLM 對話入口"""
+import asyncio
 import json
 from typing import Optional, Dict, Any
 from requests.exceptions import Timeout, RequestException
@@ -9,6 +10,15 @@ from src.dm.dialogue_manager import DialogueManager
 from src.dm.system_prompts import SystemPromptBuilder
 from src.dm.session_context import SessionContext
 
+# 錯誤類型 -> (未啟用回退時的消息, 回退也失敗時的消息)；{detail} 為異常類型名稱或 LLM 錯誤消息
+_ERROR_TEMPLATES = {
+    "network": ("通訊失敗：{detail}，請稍後再試", "系統暫時無法回應，請稍後再試（{detail}）"),
+    "json": ("數據解析失敗，請稍後再試", "系統遇到問題，請稍後再試"),
+    "max_steps": ("對話步驟過多，無法完成處理", "處理您的請求時出現問題，請稍後再試"),
+    "llm_failure": ("無法完成操作：{detail}", "處理您的請求時出現問題，請稍後再試"),
+    "unexpected": ("內部錯誤：{detail}，請稍後再試", "系統遇到內部錯誤，請稍後再試"),
+}
+
 
 class LLMConversationProcessor:
     """
@@ -22,6 +32,7 @@ class LLMConversationProcessor:
         dialogue_manager: DialogueManager,
         timeout: int = 30,
         fallback_enabled: bool = True,
+        history_window: int = 12,
     ):
         """
         初始化 LLM 對話處理器
@@ -32,12 +43,14 @@ class LLMConversationProcessor:
             dialogue_manager: DialogueManager 實例
             timeout: LLM 請求超時時間（秒）
             fallback_enabled: 是否啟用回退到傳統對話管理器
+            history_window: 每輪送給 LLM 的最近歷史訊息數（購物車狀態已在系統提示中）
         """
         self.llm = llm
         self.tool_registry = tool_registry
         self.dialogue_manager = dialogue_manager
         self.timeout = timeout
         self.fallback_enabled = fallback_enabled
+        self.history_window = history_window
         self.system_prompt_builder = SystemPromptBuilder()
 
     def handle(self, session_id: str, user_text: str) -> str:
@@ -51,6 +64,12 @@ class LLMConversationProcessor:
         Returns:
             助手回覆
         """
+        # 整個回合持有會話鎖：同一會話的回合依序執行，歷史與購物車不會被交錯改寫
+        with self.dialogue_manager.store.lock(session_id):
+            return self._handle_turn(session_id, user_text)
+
+    def _handle_turn(self, session_id: str, user_text: str) -> str:
+        """handle 的本體，呼叫端須持有該會話的鎖"""
         try:
             # 1. 獲取會話
             session = self.dialogue_manager.store.get(session_id)
@@ -63,8 +82,11 @@ class LLMConversationProcessor:
             session_context = SessionContext.from_session(session)
             system_prompt = self.system_prompt_builder.build(session_context)
 
-            # 4. 構建對話歷史（轉換為 OpenAI 格式）
-            history = self._build_message_history(session)
+            # 4. 構建對話歷史（轉換為 OpenAI 格式），只送最近 history_window 則，
+            #    避免 prefill 隨對話長度線性成長；較早的歷史仍保留在會話中
+            full_history = self._build_message_history(session)
+            history = full_history[-self.history_window:] if self.history_window > 0 else []
+            earlier = full_history[:len(full_history) - len(history)]
 
             # 5. 獲取工具定義、映射和允許參數
             tools_schema = self.tool_registry.get_tools_schema()
@@ -85,26 +107,35 @@ class LLMConversationProcessor:
             if result.get("ok"):
                 # 成功：更新會話歷史並返回回覆
                 new_history = result.get("history", history)
-                session["history"] = self._extract_session_history(new_history)
+                session["history"] = self._extract_session_history(earlier + new_history)
                 assistant_text = result.get("assistant_text", "")
                 return assistant_text
 
             else:
                 # LLM 失敗（如超出最大步數、工具執行出錯等）
                 error_msg = result.get("error", "LLM 處理失敗")
-                return self._handle_llm_failure(session_id, user_text, error_msg)
+                kind = "max_steps" if error_msg == "max_steps_exceeded" else "llm_failure"
+                return self._handle_error(kind, session_id, user_text, error_msg)
+
+        except Exception as e:
+            # 網路錯誤/超時、JSON 解析失敗或未預期的異常
+            return self._handle_error(self._classify_error(e), session_id, user_text, type(e).__name__)
 
-        except (Timeout, RequestException) as e:
-            # 網路錯誤或超時
-            return self._handle_timeout_or_network_error(session_id, user_text, e)
+    async def ahandle(self, session_id: str, user_text: str) -> str:
+        """
+        handle 的非同步版本，供 async 伺服器（FastAPI）使用
 
-        except json.JSONDecodeError as e:
-            # JSON 解析失敗
-            return self._handle_json_error(session_id, user_text, e)
+        LLM 呼叫是阻塞的 HTTP 請求，這裡把整個回合交給執行緒執行，
+        等待 LLM 時事件迴圈可以繼續處理其他會話。
 
-        except Exception as e:
-            # 未預期的異常
-            return self._handle_unexpected_error(session_id, user_text, e)
+        Args:
+            session_id: 會話 ID
+            user_text: 用戶輸入文本
+
+        Returns:
+            助手回覆
+        """
+        return await asyncio.to_thread(self.handle, session_id, user_text)
 
     # ============ 輔助方法 ============
 
@@ -154,124 +185,33 @@ class LLMConversationProcessor:
                     history.append(content)
         return history
 
-    def _handle_timeout_or_network_error(
-        self,
-        session_id: str,
-        user_text: str,
-        error: Exception,
-    ) -> str:
-        """
-        處理網路超時或連接錯誤
-
-        Args:
-            session_id: 會話 ID
-            user_text: 用戶輸入
-            error: 異常對象
-
-        Returns:
-            回退回覆或錯誤消息
-        """
-        error_type = type(error).__name__
-        error_msg = str(error)
-
-        if self.fallback_enabled:
-            # 回退到傳統對話管理器
-            try:
-                fallback_response = self.dialogue_manager.handle(session_id, user_text)
-                return fallback_response
-            except Exception as fallback_error:
-                # 回退也失敗
-                return f"系統暫時無法回應，請稍後再試（{error_type}）"
-
-        else:
-            # 不啟用回退，直接返回錯誤消息
-            return f"通訊失敗：{error_type}，請稍後再試"
+    @staticmethod
+    def _classify_error(error: Exception) -> str:
+        """把異常歸類為 _ERROR_TEMPLATES 的 key（順序同原本的 except 分支）"""
+        if isinstance(error, (Timeout, RequestException)):
+            return "network"
+        if isinstance(error, json.JSONDecodeError):
+            return "json"
+        return "unexpected"
 
-    def _handle_json_error(
-        self,
-        session_id: str,
-        user_text: str,
-        error: json.JSONDecodeError,
-    ) -> str:
+    def _handle_error(self, kind: str, session_id: str, user_text: str, detail: str) -> str:
         """
-        處理 JSON 解析錯誤
+        統一的錯誤處理：啟用回退時交給傳統對話管理器，否則回傳錯誤消息
 
         Args:
+            kind: _ERROR_TEMPLATES 的 key
             session_id: 會話 ID
             user_text: 用戶輸入
-            error: 異常對象
+            detail: 錯誤細節（異常類型名稱或 LLM 錯誤消息）
 
         Returns:
             回退回覆或錯誤消息
         """
+        no_fallback_msg, fallback_failed_msg = _ERROR_TEMPLATES[kind]
         if self.fallback_enabled:
-            # 回退到傳統對話管理器
             try:
-                fallback_response = self.dialogue_manager.handle(session_id, user_text)
-                return fallback_response
+                return self.dialogue_manager.handle(session_id, user_text)
             except Exception:
-                return "系統遇到問題，請稍後再試"
-
-        else:
-            return "數據解析失敗，請稍後再試"
-
-    def _handle_llm_failure(
-        self,
-        session_id: str,
-        user_text: str,
-        error_msg: str,
-    ) -> str:
-        """
-        處理 LLM 處理失敗（如超出最大步數等）
-
-        Args:
-            session_id: 會話 ID
-            user_text: 用戶輸入
-            error_msg: 錯誤消息
-
-        Returns:
-            回退回覆或錯誤消息
-        """
-        if self.fallback_enabled:
-            # 回退到傳統對話管理器
-            try:
-                fallback_response = self.dialogue_manager.handle(session_id, user_text)
-                return fallback_response
-            except Exception:
-                return "處理您的請求時出現問題，請稍後再試"
-
-        else:
-            if error_msg == "max_steps_exceeded":
-                return "對話步驟過多，無法完成處理"
-            else:
-                return f"無法完成操作：{error_msg}"
-
-    def _handle_unexpected_error(
-        self,
-        session_id: str,
-        user_text: str,
-        error: Exception,
-    ) -> str:
-        """
-        處理未預期的異常
-
-        Args:
-            session_id: 會話 ID
-            user_text: 用戶輸入
-            error: 異常對象
-
-        Returns:
-            回退回覆或錯誤消息
-        """
-        error_type = type(error).__name__
-
-        if self.fallback_enabled:
-            # 回退到傳統對話管理器
-            try:
-                fallback_response = self.dialogue_manager.handle(session_id, user_text)
-                return fallback_response
-            except Exception:
-                return "系統遇到內部錯誤，請稍後再試"
-
-        else:
-            return f"內部錯誤：{error_type}，請稍後再試"
+                # 回退也失敗
+                return fallback_failed_msg.format(detail=detail)
+        return no_fallback_msg.format(detail=detail)
@@ -1,12 +1,16 @@
 """LLM 驅動的訂單路由器 - 用於處理關鍵詞路由無法識別的項目"""
 import json
 import logging
+import threading
+from collections import OrderedDict
 from typing import Dict, Any, Optional
 from src.services.llm_tool_caller import LLMToolCaller
 from src.dm.session_context import SessionContext
 
 logger = logging.getLogger(__name__)
 
+_CACHE_SIZE = 2048
+
 
 class LLMRouter:
     """使用 LLM 分類未知訂單項目"""
@@ -15,7 +19,12 @@ class LLMRouter:
         self.llm = llm
         self.timeout = timeout  # 秒數
         self.confidence_threshold = confidence_threshold
-        self._cache: Dict[str, Dict[str, Any]] = {}  # 簡單快取
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()  # LRU 快取，上限 _CACHE_SIZE
+        self._hits = 0
+        self._misses = 0
+        self._cache_lock = threading.Lock()  # classify 可能在工作執行緒中並行執行
+        # 系統提示詞只隨 current_order_has_main 變化，預先建好兩種版本
+        self._system_prompts = (self._build_system_prompt(False), self._build_system_prompt(True))
 
     def classify(
         self,
@@ -42,8 +51,13 @@ class LLMRouter:
         """
         # 檢查快取
         cache_key = f"{text}|{current_order_has_main}"
-        if cache_key in self._cache:
-            return self._cache[cache_key]
+        with self._cache_lock:
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                self._hits += 1
+                self._cache.move_to_end(cache_key)
+                return cached
+            self._misses += 1
 
         try:
             result = self._classify_with_timeout(text, current_order_has_main, session_context)
@@ -58,7 +72,10 @@ class LLMRouter:
             }
 
         # 快取結果
-        self._cache[cache_key] = result
+        with self._cache_lock:
+            self._cache[cache_key] = result
+            if len(self._cache) > _CACHE_SIZE:
+                self._cache.popitem(last=False)
         return result
 
     def _classify_with_timeout(
@@ -75,7 +92,7 @@ class LLMRouter:
             context_str = self._build_context_str(session_context)
 
         # 構建系統提示詞
-        system_prompt = self._build_system_prompt(current_order_has_main)
+        system_prompt = self._system_prompts[bool(current_order_has_main)]
 
         # 構建用戶消息
         user_message = f"""用戶說: "{text}"
@@ -187,4 +204,10 @@ class LLMRouter:
 
     def clear_cache(self):
         """清除快取"""
-        self._cache.clear()
+        with self._cache_lock:
+            self._cache.clear()
+
+    def cache_stats(self) -> Dict[str, int]:
+        """快取命中統計"""
+        with self._cache_lock:
+            return {"size": len(self._cache), "hits": self._hits, "misses": self._misses}
@@ -1,18 +1,34 @@
 """會話上下文提取 - 協助 LLM 理解當前訂單狀態"""
-from typing import Dict, Any, List, Optional
-from dataclasses import dataclass, asdict
+from typing import Dict, Any, List, Optional, Tuple
+from dataclasses import dataclass
 
+# 算作主食的品項類型
+_MAIN_ITEMTYPES = frozenset({"riceball", "egg_pancake", "carrier", "combo", "snack", "jam_toast"})
 
-@dataclass
+# 品項類型的顯示名稱（購物車的飲料/飯糰/套餐另有格式）
+_CART_DISPLAY = {
+    "egg_pancake": "蛋餅",
+    "carrier": "載體",
+    "jam_toast": "吐司",
+    "snack": "點心",
+}
+_PENDING_DISPLAY = {
+    "riceball": "飯糰",
+    "drink": "飲料",
+    **_CART_DISPLAY,
+}
+
+
+@dataclass(slots=True, frozen=True)
 class SessionContext:
     """從會話提取的上下文訊息，用於 LLM 分類和澄清"""
 
     cart_count: int  # 購物車中的品項數
-    cart_items: List[str]  # 購物車品項摘要
+    cart_items: Tuple[str, ...]  # 購物車品項摘要
     has_main_item: bool  # 是否已有主食項目（飯糰等）
     has_drink: bool  # 是否已有飲料
     pending_count: int  # 待補槽的品項數
-    pending_items: List[str]  # 待補槽品項摘要
+    pending_items: Tuple[str, ...]  # 待補槽品項摘要
     current_status: str  # 會話狀態
 
     @classmethod
@@ -22,19 +38,16 @@ class SessionContext:
         pending_frames = session.get("pending_frames", [])
         status = session.get("status", "OPEN")
 
-        # 計算購物車統計
+        # 一次走訪購物車：統計主食/飲料並提取品項摘要
         cart_count = len(cart)
-        has_main_item = any(
-            item.get("itemtype") in ["riceball", "egg_pancake", "carrier", "combo", "snack", "jam_toast"]
-            for item in cart
-        )
-        has_drink = any(item.get("itemtype") == "drink" for item in cart)
-
-        # 提取購物車品項摘要
+        has_main_item = has_drink = False
         cart_items = []
         for item in cart:
             itemtype = item.get("itemtype", "unknown")
+            if itemtype in _MAIN_ITEMTYPES:
+                has_main_item = True
             if itemtype == "drink":
+                has_drink = True
                 drink_name = item.get("drink", "飲料")
                 size = item.get("size", "")
                 temp = item.get("temp", "")
@@ -48,12 +61,7 @@ class SessionContext:
                 cart_items.append(combo_name)
             else:
                 # 其他品項類型
-                itemtype_display = {
-                    "egg_pancake": "蛋餅",
-                    "carrier": "載體",
-                    "jam_toast": "吐司",
-                    "snack": "點心"
-                }.get(itemtype, itemtype)
+                itemtype_display = _CART_DISPLAY.get(itemtype, itemtype)
                 cart_items.append(itemtype_display)
 
         # 計算待補槽統計
@@ -63,26 +71,32 @@ class SessionContext:
             itemtype = frame.get("itemtype", "unknown")
             missing = frame.get("missing_slots", [])
             if missing:
-                itemtype_display = {
-                    "riceball": "飯糰",
-                    "drink": "飲料",
-                    "carrier": "載體",
-                    "egg_pancake": "蛋餅",
-                    "jam_toast": "吐司",
-                    "snack": "點心"
-                }.get(itemtype, itemtype)
+                itemtype_display = _PENDING_DISPLAY.get(itemtype, itemtype)
                 pending_items.append(f"{itemtype_display}(缺:{','.join(missing)})")
 
         return cls(
             cart_count=cart_count,
-            cart_items=cart_items,
+            cart_items=tuple(cart_items),
             has_main_item=has_main_item,
             has_drink=has_drink,
             pending_count=pending_count,
-            pending_items=pending_items,
+            pending_items=tuple(pending_items),
             current_status=status
         )
 
+    def signature(self) -> tuple:
+        """可雜湊的摘要，只含會寫進 LLM prompt 的欄位（供快取 key 使用）"""
+        return (tuple(self.cart_items), tuple(self.pending_items))
+
     def to_dict(self) -> Dict[str, Any]:
         """轉換為字典格式"""
-        return asdict(self)
+        # 淺拷貝即可：asdict 會遞迴深拷貝兩個字串串列
+        return {
+            "cart_count": self.cart_count,
+            "cart_items": list(self.cart_items),
+            "has_main_item": self.has_main_item,
+            "has_drink": self.has_drink,
+            "pending_count": self.pending_count,
+            "pending_items": list(self.pending_items),
+            "current_status": self.current_status,
+        }
@@ -1,8 +1,15 @@
-﻿from typing import Dict, Any, Optional
+﻿import threading
+import weakref
+from collections import deque
+from typing import Dict, Any, Optional
 
 class InMemorySessionStore:
     def __init__(self):
         self._data: Dict[str, Dict[str, Any]] = {}
+        # Weak values: a lock lives only while some turn holds a reference to it, so ids that are
+        # never seen again do not pin an RLock forever
+        self._locks: "weakref.WeakValueDictionary[str, threading.RLock]" = weakref.WeakValueDictionary()
+        self._guard = threading.Lock()
 
     def get(self, session_id: str, default: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         if session_id in self._data:
@@ -12,17 +19,23 @@ class InMemorySessionStore:
             return default
         
         # If session_id not in _data and no default is provided, create and return the predefined default session state
-        default_session_state = {
-            "cart": [],
-            "pending_frames": [],
-            "last_user_text": None,
-            "state": "idle",
-        }
-        self._data[session_id] = default_session_state
-        return default_session_state
+        # (under the guard so two concurrent first requests share one session dict)
+        with self._guard:
+            return self._data.setdefault(session_id, {
+                "cart": [],
+                "pending_frames": deque(),
+                "last_user_text": None,
+                "state": "idle",
+            })
+
+    def lock(self, session_id: str) -> threading.RLock:
+        """Per-session lock; hold it for a whole turn when handlers run in worker threads."""
+        with self._guard:
+            return self._locks.setdefault(session_id, threading.RLock())
 
     def set(self, session_id: str, state: Dict[str, Any]) -> None:
         self._data[session_id] = state
 
     def clear(self, session_id: str) -> None:
+        # No lock bookkeeping needed: a worker still holding the lock keeps it alive in _locks
         self._data.pop(session_id, None)
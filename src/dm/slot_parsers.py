@@ -1,11 +1,20 @@
 ﻿import re
 from typing import Dict, Any
 
+_PRICE_RE = re.compile(r"(\d{2,3})")
+
+# 米種同義詞，依優先順序比對：先混米（避免被紫/白關鍵字先吃掉），再紫米、白米
+_RICE_PATTERNS = (
+    ("混米", re.compile("紫米白米混合|紫米白米|紫白混合|混米|混合|一半一半")),
+    ("紫米", re.compile("紫糯米|黑糯米|黑米|紫米|紫的|黑的")),
+    ("白米", re.compile("白糯米|白米|白的|正常")),
+)
+
 
 def parse_strict_price_confirm(text: str, *, min_price: int = 35, step: int = 5) -> Dict[str, Any]:
     t = (text or "").strip()
 
-    m = re.search(r"(\d{2,3})", t)
+    m = _PRICE_RE.search(t)
     if not m:
         return {
             "ok": False,
@@ -44,22 +53,9 @@ def parse_rice_choice(text: str) -> Dict[str, Any]:
     """
     t = (text or "").strip()
 
-    # 先判斷混米（避免被紫/白關鍵字先吃掉）
-    mix = ["紫米白米混合", "紫米白米", "紫白混合", "混米", "混合", "一半一半"]
-    purple = ["紫糯米", "黑糯米", "黑米", "紫米", "紫的", "黑的"]
-    white = ["白糯米", "白米", "白的", "正常"]
-
-    for kw in mix:
-        if kw in t:
-            return {"ok": True, "rice": "混米", "message": None}
-
-    for kw in purple:
-        if kw in t:
-            return {"ok": True, "rice": "紫米", "message": None}
-
-    for kw in white:
-        if kw in t:
-            return {"ok": True, "rice": "白米", "message": None}
+    for rice, pattern in _RICE_PATTERNS:
+        if pattern.search(t):
+            return {"ok": True, "rice": rice, "message": None}
 
     return {"ok": False, "rice": None, "message": "請問要白米、紫米還是混米？"}
 
@@ -1,4 +1,5 @@
 """System Prompt 管理模組 - 動態生成和管理 LLM 系統提示"""
+from collections import defaultdict
 from typing import Optional, Dict, Any, List
 import os
 from src.dm.session_context import SessionContext
@@ -8,6 +9,11 @@ from src.tools.menu.menu_price_service import get_raw_menu
 class SystemPromptBuilder:
     """構建和管理動態系統提示的類"""
 
+    # 靜態前綴由所有實例（含子類別）共用，存在 SystemPromptBuilder 本身；
+    # 菜單重新載入（menu_price_service.clear_cache）後會自動重建，提示檔更新後則呼叫 invalidate_cache()
+    _shared_prefix: Optional[str] = None
+    _shared_prefix_menu: Optional[List[Dict[str, Any]]] = None  # 建前綴時的菜單物件
+
     def __init__(self):
         """初始化 SystemPromptBuilder"""
         self._base_prompt: Optional[str] = None
@@ -41,33 +47,20 @@ class SystemPromptBuilder:
         except RuntimeError as e:
             raise RuntimeError(f"Failed to load menu data: {e}")
 
-        # 按類別組織菜單
-        menu_by_category: Dict[str, List[Dict[str, Any]]] = {}
+        # 一次走訪：類別 -> 價格 -> 品名（類別維持菜單中的出現順序）
+        menu_by_category: Dict[str, Dict[int, List[str]]] = defaultdict(lambda: defaultdict(list))
         for item in menu_data:
-            category = item.get("category", "其他")
-            if category not in menu_by_category:
-                menu_by_category[category] = []
-            menu_by_category[category].append(item)
+            menu_by_category[item.get("category", "其他")][item.get("price", 0)].append(item.get("name", ""))
 
         # 生成菜單摘要 - 每個類別列出幾個代表性品項
         summary_lines = ["# 菜單摘要"]
         summary_lines.append("")
 
-        for category, items in menu_by_category.items():
+        for category, price_groups in menu_by_category.items():
             summary_lines.append(f"## {category}")
 
-            # 按價格分組顯示品項
-            price_groups: Dict[int, List[str]] = {}
-            for item in items:
-                price = item.get("price", 0)
-                name = item.get("name", "")
-                if price not in price_groups:
-                    price_groups[price] = []
-                price_groups[price].append(name)
-
             # 輸出價格層級
-            for price in sorted(price_groups.keys()):
-                names = price_groups[price]
+            for price, names in sorted(price_groups.items()):
                 if len(names) <= 3:
                     summary_lines.append(f"- ${price}: {', '.join(names)}")
                 else:
@@ -146,36 +139,55 @@ class SystemPromptBuilder:
 
         return "\n".join(lines)
 
-    def build(self, session_context: Optional[SessionContext] = None) -> str:
+    def build_prefix(self) -> str:
         """
-        構建最終的系統提示
+        構建不隨會話變動的前綴（基礎提示 + 菜單摘要 + 工具規則）
 
-        Args:
-            session_context: 可選的會話上下文，用於動態注入購物車和待補槽信息
+        每輪內容逐字相同，LLM 服務端（LM Studio / llama.cpp、OpenAI 自動前綴快取）
+        可以重用這段的 KV cache，只需處理後面的會話狀態。
 
         Returns:
-            完整的系統提示字符串
+            靜態前綴字符串
         """
-        # 加載基礎提示
-        base = self._load_base_prompt()
-
-        # 生成菜單摘要
-        menu = self._generate_menu_summary()
+        menu = get_raw_menu()
+        if SystemPromptBuilder._shared_prefix is None or SystemPromptBuilder._shared_prefix_menu is not menu:
+            # 重建時連同實例上的提示檔/菜單摘要快取一起重新讀取
+            self._base_prompt = None
+            self._menu_summary = None
+            SystemPromptBuilder._shared_prefix = "\n".join([self._load_base_prompt(), "", self._generate_menu_summary(), "", self._generate_tool_usage_rules()])
+            SystemPromptBuilder._shared_prefix_menu = menu
+        return SystemPromptBuilder._shared_prefix
+
+    @classmethod
+    def invalidate_cache(cls) -> None:
+        """清除共用的靜態前綴，下次 build 時重新讀取提示檔與菜單"""
+        SystemPromptBuilder._shared_prefix = None
+
+    def build_suffix(self, session_context: Optional[SessionContext] = None) -> str:
+        """
+        構建每輪變動的後綴（會話狀態），必須接在前綴之後
 
-        # 生成工具使用規則
-        tools = self._generate_tool_usage_rules()
+        Args:
+            session_context: 可選的會話上下文
 
-        # 格式化會話上下文（如果提供）
-        session_info = self._format_session_context(session_context)
+        Returns:
+            會話狀態字符串；沒有上下文時為空字串
+        """
+        return self._format_session_context(session_context)
 
-        # 組合所有部分
-        parts = [base, "", menu, "", tools]
+    def build(self, session_context: Optional[SessionContext] = None) -> str:
+        """
+        構建最終的系統提示
 
-        if session_info:
-            parts.append("")
-            parts.append(session_info)
+        Args:
+            session_context: 可選的會話上下文，用於動態注入購物車和待補槽信息
 
-        return "\n".join(parts)
+        Returns:
+            完整的系統提示字符串（靜態前綴在前、會話狀態在後）
+        """
+        prefix = self.build_prefix()
+        suffix = self.build_suffix(session_context)
+        return f"{prefix}\n\n{suffix}" if suffix else prefix
 
 
 def build_system_prompt(session_context: Optional[SessionContext] = None) -> str:
@@ -1,10 +1,209 @@
 """工具註冊表 - 管理 LLM 可調用的工具"""
-from typing import Dict, Any, List, Callable, Optional, Set
+from contextvars import ContextVar
+from typing import Dict, Any, List, Callable, Optional, FrozenSet, Tuple
 from src.dm.dialogue_manager import DialogueManager
 from src.dm.session_store import InMemorySessionStore
 from src.tools.menu import menu_price_service
 
 
+# OpenAI Function Calling 格式的工具 schema（靜態，模組載入時建一次）
+_TOOLS_SCHEMA: List[Dict[str, Any]] = [
+    {
+        "type": "function",
+        "function": {
+            "name": "add_to_cart",
+            "description": "添加品項到購物車",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "item_type": {
+                        "type": "string",
+                        "description": "品項類型 (riceball, drink, carrier, egg_pancake, jam_toast, snack)",
+                    },
+                    "flavor": {
+                        "type": "string",
+                        "description": "品項口味或名稱",
+                    },
+                    "rice": {
+                        "type": "string",
+                        "description": "米種 (紫米/白米/混米) - 飯糰用",
+                    },
+                    "size": {
+                        "type": "string",
+                        "description": "杯型 (中杯/大杯) - 飲料用",
+                    },
+                    "temp": {
+                        "type": "string",
+                        "description": "溫度 (冰的/溫的) - 飲料用",
+                    },
+                    "quantity": {
+                        "type": "integer",
+                        "description": "數量",
+                        "default": 1,
+                    },
+                    "large": {
+                        "type": "boolean",
+                        "description": "是否加大 - 飯糰用",
+                        "default": False,
+                    },
+                    "extra_egg": {
+                        "type": "boolean",
+                        "description": "是否加蛋 - 飯糰用",
+                        "default": False,
+                    },
+                },
+                "required": ["item_type"],
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "remove_from_cart",
+            "description": "從購物車移除品項",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "index": {
+                        "type": "integer",
+                        "description": "品項索引（1 開始），不能與 last 或 all 同時使用",
+                    },
+                    "last": {
+                        "type": "boolean",
+                        "description": "是否移除最後一項",
+                        "default": False,
+                    },
+                    "all": {
+                        "type": "boolean",
+                        "description": "是否清空購物車",
+                        "default": False,
+                    },
+                },
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_cart_summary",
+            "description": "取得購物車摘要，包括品項列表和總價",
+            "parameters": {
+                "type": "object",
+                "properties": {},
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "query_menu",
+            "description": "查詢菜單，可選擇指定分類或查看所有分類",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "category": {
+                        "type": "string",
+                        "description": "菜單分類（飯糰、飲品、蛋餅等），不指定則返回所有分類",
+                    },
+                },
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_price",
+            "description": "查詢品項價格",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "item_type": {
+                        "type": "string",
+                        "description": "品項類型",
+                    },
+                    "flavor": {
+                        "type": "string",
+                        "description": "口味或品項名稱",
+                    },
+                    "rice": {
+                        "type": "string",
+                        "description": "米種 (紫米/白米/混米)",
+                    },
+                    "size": {
+                        "type": "string",
+                        "description": "杯型 (中杯/大杯)",
+                    },
+                    "temp": {
+                        "type": "string",
+                        "description": "溫度 (冰的/溫的)",
+                    },
+                    "large": {
+                        "type": "boolean",
+                        "description": "是否加大",
+                        "default": False,
+                    },
+                    "extra_egg": {
+                        "type": "boolean",
+                        "description": "是否加蛋",
+                        "default": False,
+                    },
+                },
+                "required": ["item_type"],
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "checkout",
+            "description": "準備結帳，生成訂單摘要並等待確認",
+            "parameters": {
+                "type": "object",
+                "properties": {},
+            },
+        },
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "confirm_order",
+            "description": "確認並提交訂單，或取消訂單提交",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "confirmed": {
+                        "type": "boolean",
+                        "description": "是否確認送出訂單",
+                        "default": True,
+                    },
+                },
+            },
+        },
+    },
+]
+
+# add_to_cart：品項類型 -> ((參數名, 品項欄位), ...)，依序填入非空的參數
+_ITEM_FIELD_MAP: Dict[str, Tuple[Tuple[str, str], ...]] = {
+    "riceball": (("flavor", "flavor"), ("rice", "rice")),
+    "drink": (("flavor", "drink"), ("temp", "temp"), ("size", "size")),
+    "carrier": (("flavor", "carrier"), ("flavor", "flavor")),
+    "egg_pancake": (("flavor", "flavor"), ("size", "size")),
+    "jam_toast": (("flavor", "flavor"), ("size", "size")),
+    "snack": (("flavor", "snack"),),
+}
+
+# 每個工具允許的參數集合
+_ALLOWED_ARGS: Dict[str, FrozenSet[str]] = {
+    "add_to_cart": frozenset({"item_type", "flavor", "rice", "size", "temp", "quantity", "large", "extra_egg"}),
+    "remove_from_cart": frozenset({"index", "last", "all"}),
+    "get_cart_summary": frozenset(),
+    "query_menu": frozenset({"category"}),
+    "get_price": frozenset({"item_type", "flavor", "rice", "size", "temp", "large", "extra_egg"}),
+    "checkout": frozenset(),
+    "confirm_order": frozenset({"confirmed"}),
+}
+
+
 class ToolRegistry:
     """
     工具註冊表 - 提供 OpenAI Function Calling 格式的工具定義、執行映射和參數驗證
@@ -20,17 +219,30 @@ class ToolRegistry:
         """
         self.dm = dialogue_manager
         self.store = session_store
-        self._session_id: Optional[str] = None
+        # 當前會話 ID 放在 ContextVar：每個執行緒/工作（asyncio.to_thread 會複製 context）各自一份，
+        # 共用同一個註冊表的並行回合不會互相覆蓋
+        self._session_id: ContextVar[Optional[str]] = ContextVar(f"tool_registry_session_{id(self)}", default=None)
+        # 綁定方法只建一次，每輪直接回傳同一份映射
+        self._tool_map: Dict[str, Callable[..., Dict[str, Any]]] = {
+            "add_to_cart": self.add_to_cart,
+            "remove_from_cart": self.remove_from_cart,
+            "get_cart_summary": self.get_cart_summary,
+            "query_menu": self.query_menu,
+            "get_price": self.get_price,
+            "checkout": self.checkout,
+            "confirm_order": self.confirm_order,
+        }
 
     def set_session_id(self, session_id: str) -> None:
         """設置當前會話 ID"""
-        self._session_id = session_id
+        self._session_id.set(session_id)
 
     def get_current_session(self) -> Dict[str, Any]:
         """取得當前會話"""
-        if not self._session_id:
+        session_id = self._session_id.get()
+        if not session_id:
             raise RuntimeError("Session ID not set")
-        return self.store.get(self._session_id)
+        return self.store.get(session_id)
 
     # ============ 工具實現 ============
 
@@ -70,38 +282,15 @@ class ToolRegistry:
                 "quantity": max(1, quantity),
             }
 
-            # 根據品項類型填充字段
+            # 根據品項類型填充字段（空值不填）
+            args = {"flavor": flavor, "rice": rice, "size": size, "temp": temp}
+            for arg_name, field in _ITEM_FIELD_MAP.get(item_type, ()):
+                if args[arg_name]:
+                    item[field] = args[arg_name]
             if item_type == "riceball":
-                if flavor:
-                    item["flavor"] = flavor
-                if rice:
-                    item["rice"] = rice
                 item["large"] = bool(large)
                 item["extra_egg"] = bool(extra_egg)
 
-            elif item_type == "drink":
-                if flavor:
-                    item["drink"] = flavor
-                if temp:
-                    item["temp"] = temp
-                if size:
-                    item["size"] = size
-
-            elif item_type == "carrier":
-                if flavor:
-                    item["carrier"] = flavor
-                    item["flavor"] = flavor
-
-            elif item_type in ["egg_pancake", "jam_toast"]:
-                if flavor:
-                    item["flavor"] = flavor
-                if size:
-                    item["size"] = size
-
-            elif item_type == "snack":
-                if flavor:
-                    item["snack"] = flavor
-
             # 添加到購物車
             session["cart"].append(item)
 
@@ -244,30 +433,20 @@ class ToolRegistry:
             菜單信息
         """
         try:
-            menu_data = menu_price_service.get_raw_menu()
+            # 分類索引在菜單載入時建好，這裡只做查表
+            menu_by_category = menu_price_service.get_menu_by_category()
 
             if not category:
                 # 返回所有分類
-                categories = set()
-                for item in menu_data:
-                    if item.get("category"):
-                        categories.add(item["category"])
-
                 return {
                     "ok": True,
-                    "categories": sorted(list(categories)),
-                    "message": f"菜單共有 {len(categories)} 個分類",
+                    "categories": sorted(menu_by_category),
+                    "message": f"菜單共有 {len(menu_by_category)} 個分類",
                 }
 
             # 返回特定分類的品項
-            items = [
-                {
-                    "name": item.get("name"),
-                    "price": item.get("price"),
-                }
-                for item in menu_data
-                if item.get("category") == category
-            ]
+            # 複製一份，呼叫端改動回傳結果不會改到全域的菜單索引
+            items = [dict(item) for item in menu_by_category.get(category, ())]
 
             if not items:
                 return {
@@ -368,7 +547,7 @@ class ToolRegistry:
                 return {"ok": False, "message": "購物車為空，無法結帳"}
 
             # 生成結帳摘要
-            summary = self.dm.get_order_summary(self._session_id)
+            summary = self.dm.get_order_summary(self._session_id.get())
             total = self.dm._calculate_cart_total(session)
 
             # 標記狀態為確認中
@@ -425,180 +604,7 @@ class ToolRegistry:
         Returns:
             工具 schema 列表
         """
-        return [
-            {
-                "type": "function",
-                "function": {
-                    "name": "add_to_cart",
-                    "description": "添加品項到購物車",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "item_type": {
-                                "type": "string",
-                                "description": "品項類型 (riceball, drink, carrier, egg_pancake, jam_toast, snack)",
-                            },
-                            "flavor": {
-                                "type": "string",
-                                "description": "品項口味或名稱",
-                            },
-                            "rice": {
-                                "type": "string",
-                                "description": "米種 (紫米/白米/混米) - 飯糰用",
-                            },
-                            "size": {
-                                "type": "string",
-                                "description": "杯型 (中杯/大杯) - 飲料用",
-                            },
-                            "temp": {
-                                "type": "string",
-                                "description": "溫度 (冰的/溫的) - 飲料用",
-                            },
-                            "quantity": {
-                                "type": "integer",
-                                "description": "數量",
-                                "default": 1,
-                            },
-                            "large": {
-                                "type": "boolean",
-                                "description": "是否加大 - 飯糰用",
-                                "default": False,
-                            },
-                            "extra_egg": {
-                                "type": "boolean",
-                                "description": "是否加蛋 - 飯糰用",
-                                "default": False,
-                            },
-                        },
-                        "required": ["item_type"],
-                    },
-                },
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "remove_from_cart",
-                    "description": "從購物車移除品項",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "index": {
-                                "type": "integer",
-                                "description": "品項索引（1 開始），不能與 last 或 all 同時使用",
-                            },
-                            "last": {
-                                "type": "boolean",
-                                "description": "是否移除最後一項",
-                                "default": False,
-                            },
-                            "all": {
-                                "type": "boolean",
-                                "description": "是否清空購物車",
-                                "default": False,
-                            },
-                        },
-                    },
-                },
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "get_cart_summary",
-                    "description": "取得購物車摘要，包括品項列表和總價",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {},
-                    },
-                },
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "query_menu",
-                    "description": "查詢菜單，可選擇指定分類或查看所有分類",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "category": {
-                                "type": "string",
-                                "description": "菜單分類（飯糰、飲品、蛋餅等），不指定則返回所有分類",
-                            },
-                        },
-                    },
-                },
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "get_price",
-                    "description": "查詢品項價格",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "item_type": {
-                                "type": "string",
-                                "description": "品項類型",
-                            },
-                            "flavor": {
-                                "type": "string",
-                                "description": "口味或品項名稱",
-                            },
-                            "rice": {
-                                "type": "string",
-                                "description": "米種 (紫米/白米/混米)",
-                            },
-                            "size": {
-                                "type": "string",
-                                "description": "杯型 (中杯/大杯)",
-                            },
-                            "temp": {
-                                "type": "string",
-                                "description": "溫度 (冰的/溫的)",
-                            },
-                            "large": {
-                                "type": "boolean",
-                                "description": "是否加大",
-                                "default": False,
-                            },
-                            "extra_egg": {
-                                "type": "boolean",
-                                "description": "是否加蛋",
-                                "default": False,
-                            },
-                        },
-                        "required": ["item_type"],
-                    },
-                },
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "checkout",
-                    "description": "準備結帳，生成訂單摘要並等待確認",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {},
-                    },
-                },
-            },
-            {
-                "type": "function",
-                "function": {
-                    "name": "confirm_order",
-                    "description": "確認並提交訂單，或取消訂單提交",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "confirmed": {
-                                "type": "boolean",
-                                "description": "是否確認送出訂單",
-                                "default": True,
-                            },
-                        },
-                    },
-                },
-            },
-        ]
+        return _TOOLS_SCHEMA
 
     def get_tool_map(self) -> Dict[str, Callable[..., Dict[str, Any]]]:
         """
@@ -607,46 +613,13 @@ class ToolRegistry:
         Returns:
             工具映射字典
         """
-        return {
-            "add_to_cart": self.add_to_cart,
-            "remove_from_cart": self.remove_from_cart,
-            "get_cart_summary": self.get_cart_summary,
-            "query_menu": self.query_menu,
-            "get_price": self.get_price,
-            "checkout": self.checkout,
-            "confirm_order": self.confirm_order,
-        }
+        return self._tool_map
 
-    def get_allowed_args(self) -> Dict[str, Set[str]]:
+    def get_allowed_args(self) -> Dict[str, FrozenSet[str]]:
         """
         取得每個工具允許的參數集合
 
         Returns:
             參數映射字典
         """
-        return {
-            "add_to_cart": {
-                "item_type",
-                "flavor",
-                "rice",
-                "size",
-                "temp",
-                "quantity",
-                "large",
-                "extra_egg",
-            },
-            "remove_from_cart": {"index", "last", "all"},
-            "get_cart_summary": set(),
-            "query_menu": {"category"},
-            "get_price": {
-                "item_type",
-                "flavor",
-                "rice",
-                "size",
-                "temp",
-                "large",
-                "extra_egg",
-            },
-            "checkout": set(),
-            "confirm_order": {"confirmed"},
-        }
+        return _ALLOWED_ARGS
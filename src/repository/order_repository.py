@@ -1,23 +1,45 @@
 import sqlite3
 import json
 import os
+import threading
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+
+# 固定的 SQL 文字，讓 sqlite3 的語句快取每次都命中
+_INSERT_SQL = """
+    INSERT OR REPLACE INTO orders
+    (order_id, status, created_at, session_id, items_json, total_price, order_payload_json)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
 
 class OrderRepository:
     def __init__(self, db_path: str = "orders.db"):
         self.db_path = db_path
+        # 長連線：第一次使用時建立並重用，跨執行緒的存取由 _lock 序列化
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
         self._init_db()
 
     def _get_connection(self):
-        # 確保連線在 Windows 下能正確關閉
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+        # 呼叫端須持有 _lock
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        # 確保連線在 Windows 下能正確關閉（刪除資料庫檔前呼叫）；之後再用會重新連線
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
 
     def _init_db(self):
-        conn = self._get_connection()
-        try:
+        with self._lock:
+            conn = self._get_connection()
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS orders (
                     order_id TEXT PRIMARY KEY,
@@ -29,57 +51,65 @@ class OrderRepository:
                     order_payload_json TEXT NOT NULL
                 )
             """)
+            # list_orders 依 created_at 範圍/排序與 status 篩選
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_created_status ON orders(created_at DESC, status)")
             conn.commit()
-        finally:
-            conn.close()
 
-    def save_order(self, order_payload: Dict[str, Any], session_id: str):
-        order_id = order_payload["order_id"]
-        status = order_payload.get("status", "SUBMITTED")
+    @staticmethod
+    def _order_row(order_payload: Dict[str, Any], session_id: str) -> tuple:
         created_at = order_payload.get("created_at", datetime.now().isoformat())
-        items_json = json.dumps(order_payload.get("items", []), ensure_ascii=False)
-        total_price = order_payload.get("total_price", 0)
-        payload_json = json.dumps(order_payload, ensure_ascii=False)
+        return (
+            order_payload["order_id"],
+            order_payload.get("status", "SUBMITTED"),
+            created_at,
+            session_id,
+            json.dumps(order_payload.get("items", []), ensure_ascii=False),
+            order_payload.get("total_price", 0),
+            json.dumps(order_payload, ensure_ascii=False),
+        )
 
-        conn = self._get_connection()
-        try:
-            conn.execute("""
-                INSERT OR REPLACE INTO orders 
-                (order_id, status, created_at, session_id, items_json, total_price, order_payload_json)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (order_id, status, created_at, session_id, items_json, total_price, payload_json))
+    def save_order(self, order_payload: Dict[str, Any], session_id: str):
+        row = self._order_row(order_payload, session_id)
+        with self._lock:
+            conn = self._get_connection()
+            conn.execute(_INSERT_SQL, row)
             conn.commit()
-        finally:
-            conn.close()
+
+    def save_orders_batch(self, items: List[Tuple[Dict[str, Any], str]]):
+        # 批次寫入（匯入/重播）：單一交易 + executemany，只提交一次
+        rows = [self._order_row(payload, session_id) for payload, session_id in items]
+        with self._lock:
+            conn = self._get_connection()
+            with conn:
+                conn.executemany(_INSERT_SQL, rows)
 
     def get_order(self, order_id: str) -> Optional[Dict[str, Any]]:
-        conn = self._get_connection()
-        try:
-            row = conn.execute("SELECT order_payload_json FROM orders WHERE order_id = ?", (order_id,)).fetchone()
-            if row:
-                return json.loads(row["order_payload_json"])
-        finally:
-            conn.close()
+        with self._lock:
+            row = self._get_connection().execute("SELECT order_payload_json FROM orders WHERE order_id = ?", (order_id,)).fetchone()
+        if row:
+            return json.loads(row["order_payload_json"])
         return None
 
-    def list_orders(self, date: Optional[str] = None, status: Optional[str] = None, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+    @staticmethod
+    def _build_list_query(date: Optional[str], status: Optional[str], limit: int, offset: int) -> Tuple[str, List[Any]]:
         query = "SELECT order_payload_json FROM orders WHERE 1=1"
-        params = []
+        params: List[Any] = []
         if date:
-            query += " AND created_at LIKE ?"
-            params.append(f"{date}%")
+            # 前綴比對改成範圍查詢（ISO-8601 字串依字典序排序），才能走索引
+            query += " AND created_at >= ? AND created_at < ?"
+            params.extend([date, date[:-1] + chr(ord(date[-1]) + 1)])
         if status:
             query += " AND status = ?"
             params.append(status)
         query += " ORDER BY created_at DESC LIMIT ? OFFSET ?"
         params.extend([min(limit, 100), offset])
+        return query, params
 
-        conn = self._get_connection()
-        try:
-            rows = conn.execute(query, params).fetchall()
-            return [json.loads(r["order_payload_json"]) for r in rows]
-        finally:
-            conn.close()
+    def list_orders(self, date: Optional[str] = None, status: Optional[str] = None, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        query, params = self._build_list_query(date, status, limit, offset)
+        with self._lock:
+            rows = self._get_connection().execute(query, params).fetchall()
+        return [json.loads(r["order_payload_json"]) for r in rows]
 
 # 全域實例
 order_repo = OrderRepository()
\ No newline at end of file
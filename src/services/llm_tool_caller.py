@@ -1,8 +1,6 @@
 ﻿import json
 from typing import Any, Dict, List, Callable, Optional
 
-import requests
-
 
 class LLMToolCaller:
     def __init__(
@@ -21,6 +19,9 @@ class LLMToolCaller:
         self.max_arg_chars = max_arg_chars
 
     def _post(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        # requests 只有真的呼叫 LLM 時才載入，避免拖慢 DialogueManager 的冷啟動
+        import requests
+
         r = requests.post(self.base_url, json=payload, timeout=self.timeout)
         r.raise_for_status()
         return r.json()
@@ -124,27 +125,27 @@ class LLMToolCaller:
                 }
 
             # 1) 把模型的 tool_call 記到 messages（OpenAI 協議習慣是 assistant 帶 tool_calls）
+            tool_calls = msg.get("tool_calls") or [tool_call]
             messages.append({
                 "role": "assistant",
                 "content": msg.get("content"),
-                "tool_calls": msg.get("tool_calls", []),
+                "tool_calls": tool_calls,
             })
 
-            # 2) 執行工具
-            exec_result = self.execute_tool_call(
-                tool_call,
-                tool_map=tool_map,
-                allowed_args=allowed_args,
-            )
-            last_tool_trace.append({"tool_call": tool_call, "exec": exec_result})
-
-            # 3) 把工具輸出回灌給模型（role=tool）
-            tool_call_id = tool_call.get("id", "toolcall_0")
-            messages.append({
-                "role": "tool",
-                "tool_call_id": tool_call_id,
-                "content": json.dumps(exec_result, ensure_ascii=False),
-            })
+            # 2) 依序執行這一步的所有工具，再一起回灌給模型（role=tool）
+            #    一次回應多個呼叫時不必每個工具都多跑一趟 LLM；工具會改同一個 session，所以不並行
+            for i, tc in enumerate(tool_calls):
+                exec_result = self.execute_tool_call(
+                    tc,
+                    tool_map=tool_map,
+                    allowed_args=allowed_args,
+                )
+                last_tool_trace.append({"tool_call": tc, "exec": exec_result})
+                messages.append({
+                    "role": "tool",
+                    "tool_call_id": tc.get("id", f"toolcall_{i}"),
+                    "content": json.dumps(exec_result, ensure_ascii=False),
+                })
 
         return {"ok": False, "error": "max_steps_exceeded", "history": history, "tool_trace": last_tool_trace}
 
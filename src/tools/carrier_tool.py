@@ -56,6 +56,9 @@ class CarrierTool:
     - 加料/去料 parsing 沿用飯糰規則（ingredients_add / ingredients_remove），價表也沿用 riceball_menu_tool.ADDON_PRICE_TABLE
     """
 
+    # 推回口味後，不再把「肉/肉片/肉鬆」當作加料收費（避免雙算）
+    INFERENCE_ADDONS = frozenset({"肉", "肉片", "肉鬆"})
+
     EXTRA_SYNONYMS = {
         # 這些不是飯糰的同義詞，但載體品項常用
         "小黃瓜": "小黃瓜",
@@ -86,6 +89,9 @@ class CarrierTool:
         self.price_index = self._build_price_index(self.menu_items)
         self.flavors_by_carrier = self._build_flavors_by_carrier(self.price_index)
         self.global_flavor_set = set(flavor for (_, flavor) in self.price_index.keys())
+        # 依長度預先排好，避免每次解析/補槽時重新排序
+        self.global_flavors_longest_first = sorted(self.global_flavor_set, key=len, reverse=True)
+        self.flavors_shortest_first = {c: sorted(fs, key=len) for c, fs in self.flavors_by_carrier.items()}
 
     # ---------- public ----------
     def parse_carrier_utterance(self, text: str) -> Dict[str, Any]:
@@ -276,7 +282,7 @@ class CarrierTool:
             return None
 
         # 2) 沒 carrier：用全域 flavor 找（支援「我要一個豬肉蛋」）
-        for f in sorted(self.global_flavor_set, key=len, reverse=True):
+        for f in self.global_flavors_longest_first:
             if f and f in t:
                 return f
 
@@ -383,9 +389,7 @@ class CarrierTool:
         return None
 
     def _remove_inference_addons(self, add_ingredients: List[str]) -> List[str]:
-        # 推回口味後，不再把「肉/肉片/肉鬆」當作加料收費（避免雙算）
-        drop = {"肉", "肉片", "肉鬆"}
-        return [x for x in add_ingredients if self._normalize_ingredient(x) not in drop]
+        return [x for x in add_ingredients if self._normalize_ingredient(x) not in self.INFERENCE_ADDONS]
 
 
 carrier_tool = CarrierTool()
@@ -15,6 +15,7 @@ class ComboTool:
         """
         all_items = menu_price_service.get_raw_menu()
         self.combo_index = {}  
+        self._combo_templates = {}
         
         self.item_name_to_category = {item['name']: item['category'] for item in all_items if 'name' in item and 'category' in item}
         self.all_item_names = sorted(list(self.item_name_to_category.keys()), key=len, reverse=True)
@@ -190,7 +191,12 @@ class ComboTool:
     def explode_combo_items(self, frame: Dict[str, Any]) -> List[Dict[str, Any]]:
         short = frame.get("combo_name")
         if not short or short not in self.combo_index: return []
-        desc = self.combo_index[short]["desc"]
+        # 套餐內容固定，拆解結果按套餐快取；回傳淺拷貝，呼叫端可自由修改
+        if short not in self._combo_templates:
+            self._combo_templates[short] = self._explode_combo_desc(self.combo_index[short]["desc"])
+        return [dict(pf) for pf in self._combo_templates[short]]
+
+    def _explode_combo_desc(self, desc: str) -> List[Dict[str, Any]]:
         parts = re.split(r'[+、]', desc)
         res = []
         for p in parts:
@@ -5,14 +5,16 @@ from typing import Dict, Optional, List, Any
 # Module-level caches
 _raw_menu_cache: Optional[List[Dict[str, Any]]] = None
 _price_index_cache: Optional[Dict[str, Dict[str, int]]] = None
+_menu_by_category_cache: Optional[Dict[str, List[Dict[str, Any]]]] = None
 
 def _load_menu_if_needed():
     """
     Loads menu data from menu_all.json if not already cached.
-    Populates both the raw menu cache and the processed price index cache.
+    Populates the raw menu cache, the processed price index cache and the
+    per-category item listing cache.
     Raises RuntimeError on file loading/parsing errors.
     """
-    global _raw_menu_cache, _price_index_cache
+    global _raw_menu_cache, _price_index_cache, _menu_by_category_cache
     if _price_index_cache is not None:
         return
 
@@ -28,16 +30,20 @@ def _load_menu_if_needed():
     _raw_menu_cache = menu_data
 
     processed_index: Dict[str, Dict[str, int]] = {}
+    by_category: Dict[str, List[Dict[str, Any]]] = {}
     if isinstance(menu_data, list):
         for item in menu_data:
             category = item.get("category")
             name = item.get("name")
             price = item.get("price")
+            if category:
+                by_category.setdefault(category, []).append({"name": name, "price": price})
             if category and name and isinstance(price, int):
                 if category not in processed_index:
                     processed_index[category] = {}
                 processed_index[category][name] = price
     
+    _menu_by_category_cache = by_category
     _price_index_cache = processed_index
 
 def get_price(category: str, name: str) -> int:
@@ -66,8 +72,16 @@ def get_raw_menu() -> List[Dict[str, Any]]:
     # Non-null assertion is safe because _load_menu_if_needed populates it.
     return _raw_menu_cache
 
+def get_menu_by_category() -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Returns the menu items ({"name", "price"}) grouped by category.
+    """
+    _load_menu_if_needed()
+    return _menu_by_category_cache
+
 def clear_cache():
     """Clears the module-level cache. Useful for testing."""
-    global _raw_menu_cache, _price_index_cache
+    global _raw_menu_cache, _price_index_cache, _menu_by_category_cache
     _raw_menu_cache = None
     _price_index_cache = None
+    _menu_by_category_cache = None
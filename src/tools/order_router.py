@@ -1,4 +1,5 @@
 """訂單路由器 - 物件介面"""
+import re
 from typing import Dict, Any, List
 from src.tools.snack_tool import snack_tool
 
@@ -28,6 +29,12 @@ CLEAR_ALL_KEYWORDS = ["全部取消", "清空購物車", "都不要了", "全部
 REMOVE_INDEX_KEYWORDS = ["刪除第", "取消第", "個不要", "項不要", "刪第"]
 CHECKOUT_KEYWORDS = ["結帳", "送出", "下單", "就這些", "買單", "結案", "沒了"]
 
+# 意圖關鍵字各編成一個 regex，一次掃描；新增關鍵字只需改上面的串列
+_CHECKOUT_RE = re.compile("|".join(map(re.escape, CHECKOUT_KEYWORDS)))
+_CLEAR_ALL_RE = re.compile("|".join(map(re.escape, CLEAR_ALL_KEYWORDS)))
+_REMOVE_INDEX_RE = re.compile("|".join(map(re.escape, REMOVE_INDEX_KEYWORDS)))
+_CANCEL_LAST_RE = re.compile("|".join(map(re.escape, CANCEL_LAST_KEYWORDS)))
+
 
 def normalize_text(text: str) -> str:
     t = text
@@ -40,16 +47,16 @@ def _route(text: str, current_order_has_main: bool = False) -> Dict[str, Any]:
     t = normalize_text(text)
 
     # 0. 結帳與編輯路由 (優先級高)
-    if any(kw in t for kw in CHECKOUT_KEYWORDS):
+    if _CHECKOUT_RE.search(t):
         return {"route_type": "checkout", "needs_clarify": False}
 
-    if any(kw in t for kw in CLEAR_ALL_KEYWORDS):
+    if _CLEAR_ALL_RE.search(t):
         return {"route_type": "clear_all", "needs_clarify": False}
     
-    if any(kw in t for kw in REMOVE_INDEX_KEYWORDS) or (("第" in t) and ("項" in t or "個" in t) and ("刪" in t or "取消" in t)):
+    if _REMOVE_INDEX_RE.search(t) or (("第" in t) and ("項" in t or "個" in t) and ("刪" in t or "取消" in t)):
         return {"route_type": "remove_index", "needs_clarify": False}
 
-    if any(kw in t for kw in CANCEL_LAST_KEYWORDS):
+    if _CANCEL_LAST_RE.search(t):
         return {"route_type": "cancel_last", "needs_clarify": False}
     
     if t == "取消": # 純粹的取消，交給 DM 根據狀態判斷
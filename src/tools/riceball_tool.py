@@ -3,6 +3,7 @@
 （維持 menu_tool 介面供 llm_service 使用）
 """
 
+import functools
 import re
 import json
 from typing import List, Dict, Any, Optional
@@ -120,6 +121,7 @@ def _dedupe_keep_order(xs: List[str]) -> List[str]:
     return list(dict.fromkeys(xs or []))
 
 
+@functools.lru_cache(maxsize=128)
 def _chinese_number_to_int(token: str) -> Optional[int]:
     """
     支援 0~99 的中文數字（含：十、十五、二十、二十五、兩…）
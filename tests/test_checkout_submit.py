@@ -92,3 +92,72 @@ def test_order_payload_format(dm_session):
     assert payload["items"][0]["unit_price"] == 20
     assert payload["total_price"] == 20
     assert "created_at" in payload
+
+def test_blank_input_after_submit_keeps_frozen_reply(dm_session):
+    dm = dm_session["dm"]
+    sid = dm_session["session_id"]
+
+    dm.handle(sid, "我要一個薯餅")
+    dm.handle(sid, "結帳")
+    dm.handle(sid, "確定")
+
+    response = dm.handle(sid, "   ")
+    assert "訂單已送出" in response
+
+def test_order_summary_reports_unpriceable_item(dm_session):
+    dm = dm_session["dm"]
+    sid = dm_session["session_id"]
+
+    session = dm.store.get(sid)
+    session["cart"] = [
+        {"itemtype": "snack", "snack": "薯餅(1片)", "quantity": 1},
+        {"itemtype": "riceball", "flavor": "不存在口味", "rice": "白米"},
+    ]
+
+    summary = dm.get_order_summary(sid)
+    assert summary.startswith("品項「白米·不存在口味」無法計價")
+    assert "請洽服務人員再結帳" in summary
+
+    session["cart"] = [{"itemtype": "mystery"}]
+    assert dm.get_order_summary(sid) == "品項「未知品項」無法計價：計價失敗。請洽服務人員再結帳。"
+
+def test_price_info_cached_per_item_signature(dm_session, monkeypatch):
+    from src.tools.snack_tool import snack_tool
+
+    dm = dm_session["dm"]
+    calls = []
+    original = snack_tool.quote_snack_price
+
+    def counting_quote(frame):
+        calls.append(frame.get("snack"))
+        return original(frame)
+
+    monkeypatch.setattr(snack_tool, "quote_snack_price", counting_quote)
+
+    item = {"itemtype": "snack", "snack": "薯餅(1片)", "quantity": 1, "raw_text": "薯餅"}
+    first = dm._get_price_info(item)
+    again = dm._get_price_info(dict(item, raw_text="我要一個薯餅"))
+    assert again == first and again is not first
+    assert len(calls) == 1
+
+    # 回傳的是副本，改動不影響快取中的報價
+    first["total_price"] = 0
+    assert dm._get_price_info(item)["total_price"] == again["total_price"]
+
+    dm._get_price_info(dict(item, quantity=2))
+    assert len(calls) == 2
+
+def test_order_summary_with_store_requiring_default():
+    class StrictStore:
+        def __init__(self):
+            self.data = {}
+
+        def get(self, session_id, default):
+            return self.data.get(session_id, default)
+
+    store = StrictStore()
+    dm = DialogueManager(store=store)
+    assert dm.get_order_summary("missing") == "目前沒有品項"
+
+    store.data["sid"] = {"cart": [{"itemtype": "snack", "snack": "薯餅(1片)", "quantity": 1}]}
+    assert "共 20元" in dm.get_order_summary("sid")
@@ -95,3 +95,15 @@ def test_combo_swap_price_injection_still_blocked(dm_session):
     response = dm.handle(session_id, "結帳")
     assert "145元" in response
     assert "50元" not in response
+
+def test_extract_size_from_canonical_drink_name():
+    from src.dm.dialogue_manager import _extract_size
+    assert _extract_size("精選紅茶(大)") == "大杯"
+    assert _extract_size("精選紅茶(中)") == "中杯"
+    assert _extract_size("精選紅茶") == "中杯"
+
+def test_display_drink_name_strips_menu_markers():
+    from src.dm.dialogue_manager import _display_drink_name
+    assert _display_drink_name("精選有糖紅茶(大)") == "紅茶大杯"
+    assert _display_drink_name("無糖豆漿(中)") == "豆漿中杯"
+    assert _display_drink_name("鮮奶茶") == "鮮奶茶"
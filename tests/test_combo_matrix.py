@@ -156,3 +156,17 @@ def test_combo_two_plus_snack(dm_session):
     assert "90元" in response
     # "共 2 個品項"
     assert "2 個品項" in response
+
+def test_combo_explode_returns_fresh_frames():
+    """
+    拆解結果有快取，但每次回傳的子品項 frame 必須是新的 dict，
+    避免上一筆訂單補槽時的修改汙染下一筆套餐。
+    """
+    from src.tools.combo_tool import combo_tool
+
+    first = combo_tool.explode_combo_items({"combo_name": "套餐二"})
+    assert first
+    first[0]["rice"] = "白米"
+    second = combo_tool.explode_combo_items({"combo_name": "套餐二"})
+    assert second[0] is not first[0]
+    assert "rice" not in second[0]
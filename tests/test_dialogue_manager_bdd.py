@@ -161,3 +161,21 @@ def test_egg_pancake_menu_load_error_handling(monkeypatch):
     # Assert
     assert "菜單讀取失敗，請洽服務人員。" in response
 
+
+def test_blank_input_reasks_pending_slot():
+    """空白輸入時，若仍有待補品項，應重問該品項而不是重新開始"""
+    dm = DialogueManager()
+    session_id = "test_session_blank_reask"
+
+    response = dm.handle(session_id, "鮪魚飯糰")
+    assert response == "還差米種，你要紫米、白米還是混米？"
+
+    response = dm.handle(session_id, "  ")
+    assert response == "還差米種，你要紫米、白米還是混米？"
+    assert len(dm.store.get(session_id)["pending_frames"]) == 1
+
+
+def test_blank_input_on_empty_session():
+    """空白輸入且沒有待補品項時，直接提示點餐"""
+    dm = DialogueManager()
+    assert dm.handle("test_session_blank_empty", "") == "請問要點什麼？"
@@ -90,3 +90,19 @@ def test_order_shortcut_medium_warm_red_tea(dm_session):
 
     response = dm.handle(session_id, "我要一杯中溫紅")
     assert "好的，1份 精選紅茶(中杯, 溫)，還需要什麼嗎？" in response
+
+def test_tool_exception_is_logged_and_reported(dm_session, monkeypatch, caplog):
+    """工具拋出例外時，應記錄 traceback 並回覆內部錯誤訊息"""
+    from src.tools.drink_tool import drink_tool
+
+    def boom(text):
+        raise ValueError("boom")
+
+    monkeypatch.setattr(drink_tool, "parse_drink_utterance", boom)
+    with caplog.at_level("ERROR", logger="src.dm.dialogue_manager"):
+        response = dm_session["dm"].handle(dm_session["session_id"], "我要一杯豆漿")
+
+    assert response == "處理您的請求時發生內部錯誤。"
+    record = next(r for r in caplog.records if r.name == "src.dm.dialogue_manager")
+    assert record.getMessage() == "Tool error for drink"
+    assert record.exc_info is not None
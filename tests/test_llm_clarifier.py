@@ -125,6 +125,67 @@ class TestLLMClarifierCache:
         assert mock_llm.call_llm.call_count == 1
         assert result1 == result2
 
+    def test_cache_is_bounded(self, llm_clarifier, mock_llm, monkeypatch):
+        """測試快取有上限，超過時淘汰最久未使用的項目"""
+        monkeypatch.setattr("src.dm.llm_clarifier._CACHE_SIZE", 2)
+        mock_llm.call_llm.return_value = {
+            "choices": [{
+                "message": {
+                    "content": "上限測試"
+                }
+            }]
+        }
+
+        llm_clarifier.generate_question("drink", ["temp"])
+        llm_clarifier.generate_question("drink", ["size"])
+        # 命中 temp，使 size 變成最久未使用
+        llm_clarifier.generate_question("drink", ["temp"])
+        llm_clarifier.generate_question("riceball", ["rice"])
+
+        assert [key[:2] for key in llm_clarifier._cache] == [("drink", "temp"), ("riceball", "rice")]
+
+    def test_cache_concurrent_generate(self, llm_clarifier, mock_llm, monkeypatch):
+        """測試多執行緒同時產生問題時快取不出錯且維持上限"""
+        from concurrent.futures import ThreadPoolExecutor
+
+        monkeypatch.setattr("src.dm.llm_clarifier._CACHE_SIZE", 2)
+        mock_llm.call_llm.return_value = {
+            "choices": [{
+                "message": {
+                    "content": "並行測試"
+                }
+            }]
+        }
+        slots = ["temp", "size", "sugar", "ice"] * 50
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            questions = list(pool.map(lambda slot: llm_clarifier.generate_question("drink", [slot]), slots))
+
+        assert all(q for q in questions)
+        assert len(llm_clarifier._cache) <= 2
+
+    def test_cache_key_includes_frame_and_context(self, llm_clarifier, mock_llm):
+        """測試不同的已知槽位或會話上下文不共用快取，raw_text 不影響命中"""
+        mock_llm.call_llm.return_value = {
+            "choices": [{
+                "message": {
+                    "content": "要幾分糖？"
+                }
+            }]
+        }
+        empty = SessionContext.from_session({})
+
+        llm_clarifier.generate_question("drink", ["temp"], {"drink": "紅茶", "raw_text": "紅茶"}, empty)
+        llm_clarifier.generate_question("drink", ["temp"], {"drink": "紅茶", "raw_text": "一杯紅茶"}, empty)
+        assert mock_llm.call_llm.call_count == 1
+
+        llm_clarifier.generate_question("drink", ["temp"], {"drink": "奶茶"}, empty)
+        assert mock_llm.call_llm.call_count == 2
+
+        busy = SessionContext.from_session({"cart": [{"itemtype": "snack"}]})
+        llm_clarifier.generate_question("drink", ["temp"], {"drink": "奶茶"}, busy)
+        assert mock_llm.call_llm.call_count == 3
+
     def test_clear_cache(self, llm_clarifier, mock_llm):
         """測試清除快取"""
         mock_llm.call_llm.return_value = {
@@ -1,6 +1,8 @@
 """LLM 集成與備選行為測試"""
+import json
 import pytest
 from unittest.mock import Mock, patch
+from requests.exceptions import Timeout
 from src.dm.dialogue_manager import DialogueManager
 from src.dm.llm_router import LLMRouter
 from src.dm.llm_clarifier import LLMClarifier
@@ -184,6 +186,234 @@ class TestLLMClarifierFallback:
         # 應該備選至硬編碼問題
         assert "冰" in msg or "溫" in msg
 
+    def test_clarify_uses_handled_session_context(self, store):
+        """測試澄清器拿到的是當前處理中會話的上下文"""
+        clarifier = Mock()
+        clarifier.generate_question.return_value = "要冰的還是溫的？"
+        dm = DialogueManager(store=store, llm_clarifier=clarifier, llm_enabled=True)
+
+        dm.handle("s1", "我要一個薯餅")
+        msg = dm.handle("s1", "再一杯紅茶")
+
+        assert msg == "要冰的還是溫的？"
+        context = clarifier.generate_question.call_args.args[3]
+        assert context.cart_count == 1
+        assert context.pending_count == 1
+
+
+class TestConversationProcessorAsync:
+    """LLM 對話處理器非同步入口測試"""
+
+    def test_ahandle_matches_handle(self, store, mock_llm):
+        """測試 ahandle 在執行緒中跑完整回合，結果與 handle 相同"""
+        import asyncio
+        from src.dm.llm_conversation_processor import LLMConversationProcessor
+        from src.dm.tool_registry import ToolRegistry
+
+        mock_llm.run_turn.return_value = {"ok": True, "assistant_text": "好的，請問要什麼口味？", "history": []}
+        dm = DialogueManager(store=store)
+        processor = LLMConversationProcessor(
+            llm=mock_llm,
+            tool_registry=ToolRegistry(dm, store),
+            dialogue_manager=dm,
+        )
+
+        reply = asyncio.run(processor.ahandle("s1", "我要飯糰"))
+
+        assert reply == "好的，請問要什麼口味？"
+        assert mock_llm.run_turn.call_args.kwargs["user_text"] == "我要飯糰"
+
+    def test_ahandle_overlapping_sessions_keep_their_own_carts(self, store, mock_llm):
+        """測試兩個會話的回合在執行緒中重疊時，工具呼叫各自寫入自己的購物車"""
+        import asyncio
+        import threading
+        from src.dm.llm_conversation_processor import LLMConversationProcessor
+        from src.dm.tool_registry import ToolRegistry
+
+        both_started = threading.Barrier(2, timeout=5)
+
+        def fake_run_turn(*, user_text, tool_map, **kwargs):
+            both_started.wait()  # 兩個回合都已設好會話 ID 後才執行工具
+            tool_map["add_to_cart"](item_type="drink", flavor=user_text)
+            return {"ok": True, "assistant_text": "好的", "history": []}
+
+        mock_llm.run_turn.side_effect = fake_run_turn
+        dm = DialogueManager(store=store)
+        processor = LLMConversationProcessor(
+            llm=mock_llm,
+            tool_registry=ToolRegistry(dm, store),
+            dialogue_manager=dm,
+        )
+
+        async def run_both():
+            return await asyncio.gather(processor.ahandle("s1", "紅茶"), processor.ahandle("s2", "豆漿"))
+
+        assert asyncio.run(run_both()) == ["好的", "好的"]
+        assert [i["drink"] for i in store.get("s1")["cart"]] == ["紅茶"]
+        assert [i["drink"] for i in store.get("s2")["cart"]] == ["豆漿"]
+
+    def test_handle_holds_session_lock_for_the_whole_turn(self, store, mock_llm):
+        """測試 handle 整個回合持有會話鎖，其他執行緒拿不到同一會話的鎖"""
+        import threading
+        from src.dm.llm_conversation_processor import LLMConversationProcessor
+        from src.dm.tool_registry import ToolRegistry
+
+        acquired_elsewhere = []
+
+        def fake_run_turn(**kwargs):
+            t = threading.Thread(target=lambda: acquired_elsewhere.append(store.lock("s1").acquire(blocking=False)))
+            t.start()
+            t.join()
+            return {"ok": True, "assistant_text": "好的", "history": []}
+
+        mock_llm.run_turn.side_effect = fake_run_turn
+        dm = DialogueManager(store=store)
+        processor = LLMConversationProcessor(
+            llm=mock_llm,
+            tool_registry=ToolRegistry(dm, store),
+            dialogue_manager=dm,
+        )
+
+        assert processor.handle("s1", "結帳") == "好的"
+        assert acquired_elsewhere == [False]
+
+    def test_history_window_limits_prompt_but_keeps_session_history(self, store, mock_llm):
+        """測試只送最近的歷史給 LLM，但會話中的完整歷史不被截斷"""
+        from src.dm.llm_conversation_processor import LLMConversationProcessor
+        from src.dm.tool_registry import ToolRegistry
+
+        def fake_run_turn(*, user_text, history, **kwargs):
+            return {"ok": True, "assistant_text": "好的",
+                    "history": history + [{"role": "user", "content": user_text},
+                                          {"role": "assistant", "content": "好的"}]}
+
+        mock_llm.run_turn.side_effect = fake_run_turn
+        dm = DialogueManager(store=store)
+        processor = LLMConversationProcessor(
+            llm=mock_llm,
+            tool_registry=ToolRegistry(dm, store),
+            dialogue_manager=dm,
+            history_window=4,
+        )
+        session = store.get("s1")
+        session["history"] = [f"msg{i}" for i in range(10)]
+
+        processor.handle("s1", "結帳")
+
+        sent = mock_llm.run_turn.call_args.kwargs["history"]
+        assert [m["content"] for m in sent] == ["msg6", "msg7", "msg8", "msg9"]
+        assert session["history"] == [f"msg{i}" for i in range(10)] + ["結帳", "好的"]
+
+    @pytest.mark.parametrize("outcome, expected", [
+        (Timeout("slow"), "通訊失敗：Timeout，請稍後再試"),
+        (json.JSONDecodeError("bad", "", 0), "數據解析失敗，請稍後再試"),
+        (KeyError("x"), "內部錯誤：KeyError，請稍後再試"),
+        ({"ok": False, "error": "max_steps_exceeded"}, "對話步驟過多，無法完成處理"),
+        ({"ok": False, "error": "tool_error"}, "無法完成操作：tool_error"),
+    ])
+    def test_error_messages_without_fallback(self, store, mock_llm, outcome, expected):
+        """測試未啟用回退時各類錯誤的回覆消息"""
+        from src.dm.llm_conversation_processor import LLMConversationProcessor
+        from src.dm.tool_registry import ToolRegistry
+
+        if isinstance(outcome, Exception):
+            mock_llm.run_turn.side_effect = outcome
+        else:
+            mock_llm.run_turn.return_value = outcome
+        dm = DialogueManager(store=store)
+        processor = LLMConversationProcessor(
+            llm=mock_llm,
+            tool_registry=ToolRegistry(dm, store),
+            dialogue_manager=dm,
+            fallback_enabled=False,
+        )
+
+        assert processor.handle("s1", "我要飯糰") == expected
+
+
+class TestToolRegistryTables:
+    """工具註冊表靜態表測試"""
+
+    def test_tool_registry_tables_are_built_once_and_consistent(self, store):
+        """測試工具 schema/映射/允許參數每輪回傳同一份，且工具名稱一致"""
+        from src.dm.tool_registry import ToolRegistry
+
+        registry = ToolRegistry(DialogueManager(store=store), store)
+        names = [t["function"]["name"] for t in registry.get_tools_schema()]
+
+        assert registry.get_tools_schema() is registry.get_tools_schema()
+        assert registry.get_tool_map() is registry.get_tool_map()
+        assert set(names) == set(registry.get_tool_map()) == set(registry.get_allowed_args())
+
+    def test_query_menu_result_does_not_alias_menu_index(self, store):
+        """測試改動 query_menu 的回傳結果不會改到全域菜單索引"""
+        from src.dm.tool_registry import ToolRegistry
+
+        registry = ToolRegistry(DialogueManager(store=store), store)
+        result = registry.query_menu("蛋餅")
+        result["items"].clear()
+
+        assert registry.query_menu("蛋餅")["count"] > 0
+
+    @pytest.mark.parametrize("kwargs, expected", [
+        ({"item_type": "drink", "flavor": "紅茶", "temp": "冰", "size": "大杯"},
+         {"itemtype": "drink", "quantity": 1, "drink": "紅茶", "temp": "冰", "size": "大杯"}),
+        ({"item_type": "carrier", "flavor": "火腿"},
+         {"itemtype": "carrier", "quantity": 1, "carrier": "火腿", "flavor": "火腿"}),
+        ({"item_type": "riceball", "flavor": "醬燒里肌", "rice": "", "large": True},
+         {"itemtype": "riceball", "quantity": 1, "flavor": "醬燒里肌", "large": True, "extra_egg": False}),
+        ({"item_type": "snack", "flavor": "薯餅", "size": "大"},
+         {"itemtype": "snack", "quantity": 1, "snack": "薯餅"}),
+    ])
+    def test_add_to_cart_fills_fields_per_item_type(self, store, kwargs, expected):
+        """測試 add_to_cart 依品項類型填入欄位，空值與不適用的參數不填"""
+        from src.dm.tool_registry import ToolRegistry
+
+        registry = ToolRegistry(DialogueManager(store=store), store)
+        registry.set_session_id("s1")
+
+        assert registry.add_to_cart(**kwargs)["ok"] is True
+        assert store.get("s1")["cart"][-1] == expected
+
+
+class TestToolCallerRunTurn:
+    """LLMToolCaller 回合測試"""
+
+    def test_run_turn_executes_all_tool_calls_in_one_step(self):
+        """測試模型一次回應多個工具呼叫時，同一步依序執行並全部回灌，只多一次 LLM 往返"""
+        from src.services.llm_tool_caller import LLMToolCaller
+
+        caller = LLMToolCaller()
+        tool_calls = [
+            {"id": "a", "function": {"name": "add", "arguments": '{"item": "薯餅"}'}},
+            {"id": "b", "function": {"name": "add", "arguments": '{"item": "紅茶"}'}},
+        ]
+        responses = iter([
+            {"choices": [{"message": {"content": None, "tool_calls": tool_calls}}]},
+            {"choices": [{"message": {"content": "好的，薯餅和紅茶"}}]},
+        ])
+        sent = []
+
+        def fake_call_llm(*, messages, **kwargs):
+            sent.append(list(messages))
+            return next(responses)
+
+        caller.call_llm = fake_call_llm
+        added = []
+        result = caller.run_turn(
+            system_prompt="sys",
+            user_text="薯餅跟紅茶",
+            history=[],
+            tools_schema=[],
+            tool_map={"add": lambda item: added.append(item) or {"ok": True}},
+            allowed_args={"add": {"item"}},
+        )
+
+        assert result["ok"] is True
+        assert added == ["薯餅", "紅茶"]
+        assert len(sent) == 2
+        assert [m["tool_call_id"] for m in sent[1] if m["role"] == "tool"] == ["a", "b"]
+
 
 class TestSessionContextIntegration:
     """會話上下文集成測試"""
@@ -205,6 +435,17 @@ class TestSessionContextIntegration:
         assert len(context.cart_items) == 1
         assert len(context.pending_items) == 1
 
+    def test_session_context_is_frozen_and_hashable(self, store):
+        """上下文不可變，可直接當快取 key"""
+        import dataclasses
+        from src.dm.session_context import SessionContext
+
+        session = {"cart": [{"itemtype": "drink", "drink": "豆漿"}], "pending_frames": [], "status": "OPEN"}
+        context = SessionContext.from_session(session)
+        assert hash(context) == hash(SessionContext.from_session(session))
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            context.cart_count = 2
+
     def test_session_context_empty_session(self, store):
         """測試空會話的上下文"""
         from src.dm.session_context import SessionContext
@@ -246,3 +487,60 @@ class TestBackwardCompatibility:
         # 如果配置了 LM Studio，應該能夠訪問
         if lm_studio_url:
             assert lm_studio_url.startswith("http")
+
+
+class TestSystemPromptPrefix:
+    """系統提示前綴快取測試"""
+
+    def test_prefix_is_stable_across_sessions(self):
+        """測試不同會話的系統提示共用同一段前綴，會話狀態只出現在後面"""
+        from src.dm.session_context import SessionContext
+        from src.dm.system_prompts import SystemPromptBuilder
+
+        builder = SystemPromptBuilder()
+        prefix = builder.build_prefix()
+        empty = builder.build(SessionContext.from_session({}))
+        busy = builder.build(SessionContext.from_session({"cart": [{"itemtype": "drink", "drink": "豆漿"}]}))
+
+        assert empty.startswith(prefix + "\n\n")
+        assert busy.startswith(prefix + "\n\n")
+        assert "當前會話狀態" not in prefix
+        assert builder.build() == prefix
+
+    def test_prefix_shared_until_invalidated(self):
+        """測試靜態前綴跨實例共用，invalidate_cache 後重新生成"""
+        from src.dm.system_prompts import SystemPromptBuilder
+
+        SystemPromptBuilder.invalidate_cache()
+        first = SystemPromptBuilder().build_prefix()
+        assert SystemPromptBuilder().build_prefix() is first
+
+        SystemPromptBuilder.invalidate_cache()
+        rebuilt = SystemPromptBuilder().build_prefix()
+        assert rebuilt is not first
+        assert rebuilt == first
+
+    def test_prefix_rebuilt_after_menu_reload(self):
+        """測試菜單重新載入後靜態前綴會重建"""
+        from src.dm.system_prompts import SystemPromptBuilder
+        from src.tools.menu import menu_price_service
+
+        builder = SystemPromptBuilder()
+        first = builder.build_prefix()
+        menu_price_service.clear_cache()
+
+        assert builder.build_prefix() is not first
+
+    def test_base_invalidate_clears_prefix_built_by_subclass(self):
+        """測試子類別建立的前綴存在基底類別上，基底的 invalidate_cache 可清除"""
+        from src.dm.system_prompts import SystemPromptBuilder
+
+        class CustomBuilder(SystemPromptBuilder):
+            pass
+
+        SystemPromptBuilder.invalidate_cache()
+        first = CustomBuilder().build_prefix()
+        assert SystemPromptBuilder().build_prefix() is first
+
+        SystemPromptBuilder.invalidate_cache()
+        assert CustomBuilder().build_prefix() is not first
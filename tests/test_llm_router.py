@@ -120,6 +120,48 @@ class TestLLMRouterCache:
         assert mock_llm.call_llm.call_count == 1
         assert result1 == result2
 
+    def test_cache_is_bounded_lru(self, llm_router, mock_llm, monkeypatch):
+        """測試快取有上限並淘汰最久未使用的項目，同時記錄命中統計"""
+        monkeypatch.setattr("src.dm.llm_router._CACHE_SIZE", 2)
+        mock_llm.call_llm.return_value = {
+            "choices": [{
+                "message": {
+                    "content": '{"route_type": "drink", "confidence": 0.9, "reasoning": "上限", "alternatives": []}'
+                }
+            }]
+        }
+
+        llm_router.classify("紅茶")
+        llm_router.classify("奶茶")
+        # 命中紅茶，使奶茶變成最久未使用
+        llm_router.classify("紅茶")
+        llm_router.classify("豆漿")
+
+        assert list(llm_router._cache) == ["紅茶|False", "豆漿|False"]
+        assert llm_router.cache_stats() == {"size": 2, "hits": 1, "misses": 3}
+
+    def test_cache_concurrent_classify(self, llm_router, mock_llm, monkeypatch):
+        """測試多執行緒同時分類時快取不出錯，統計不遺失"""
+        from concurrent.futures import ThreadPoolExecutor
+
+        monkeypatch.setattr("src.dm.llm_router._CACHE_SIZE", 4)
+        mock_llm.call_llm.return_value = {
+            "choices": [{
+                "message": {
+                    "content": '{"route_type": "drink", "confidence": 0.9, "reasoning": "並行", "alternatives": []}'
+                }
+            }]
+        }
+        texts = [f"飲料{i % 8}" for i in range(400)]
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(llm_router.classify, texts))
+
+        assert all(r["route_type"] == "drink" for r in results)
+        stats = llm_router.cache_stats()
+        assert stats["hits"] + stats["misses"] == len(texts)
+        assert stats["size"] <= 4
+
     def test_clear_cache(self, llm_router, mock_llm):
         """測試清除快取"""
         mock_llm.call_llm.return_value = {
@@ -103,4 +103,109 @@ def test_multi_item_two_pending_and_queue(dm_session):
     
     response = dm.handle(session_id, "結帳")
     assert "這樣一共" in response
-    assert "80元" in response # 25 (drink) + 55 (carrier)
\ No newline at end of file
+    assert "80元" in response # 25 (drink) + 55 (carrier)
+
+def test_list_seeded_pending_frames_still_work(dm_session):
+    """外部以 list 寫入的 pending_frames 仍可正常補槽"""
+    dm = dm_session["dm"]
+    session_id = dm_session["session_id"]
+
+    dm.handle(session_id, "我要豆漿跟一個鮪魚蛋")
+    session = dm.store.get(session_id)
+    session["pending_frames"] = list(session["pending_frames"])
+
+    response = dm.handle(session_id, "大杯冰的")
+    assert "你要漢堡、吐司還是饅頭？" in response
+
+    session = dm.store.get(session_id)
+    assert len(session["cart"]) == 1
+    assert len(session["pending_frames"]) == 1
+    assert session["pending_frames"][0]["flavor"] == "鮪魚蛋"
+
+def test_split_utterance_on_all_keywords(dm_session):
+    """單字元標點與多字元連接詞都應切開品項"""
+    dm = dm_session["dm"]
+    spans = dm._split_utterance("我要大冰奶跟一份薯餅，再給我一個飯糰、還要紅茶再一份蛋餅")
+    assert spans == ["我要大冰奶", "一份薯餅", "一個飯糰", "紅茶", "蛋餅"]
+    assert dm._split_utterance("") == []
+    assert dm._split_utterance("、，跟") == []
+
+@pytest.mark.parametrize("rtype, frame, expected", [
+    ("riceball", {}, ["flavor", "rice"]),
+    ("riceball", {"flavor": "鮪魚"}, ["rice"]),
+    ("drink", {"drink": "紅茶"}, ["temp", "size"]),
+    ("carrier", {"flavor": "鮪魚蛋"}, ["carrier"]),
+    ("jam_toast", {}, ["flavor", "size"]),
+    ("jam_toast", {"jam_toast": "草莓吐司", "size": "厚片"}, []),
+    ("egg_pancake", {}, ["flavor"]),
+    ("snack", {"snack": "薯餅"}, []),
+    ("combo", {}, []),
+    ("drink", {"_price_driven_confirm": True}, ["_price_driven_confirm"]),
+])
+def test_recompute_missing_slots(dm_session, rtype, frame, expected):
+    assert dm_session["dm"]._recompute_missing_slots(rtype, frame) == expected
+
+@pytest.mark.parametrize("rtype, missing, expected", [
+    ("drink", ["temp"], "你要冰的、溫的？"),
+    ("drink", ["size"], "大杯還中杯？"),
+    ("drink", ["drink"], "請問要什麼飲料？"),
+    ("riceball", ["rice"], "還差米種，你要紫米、白米還是混米？"),
+    ("carrier", ["carrier", "flavor"], "你要漢堡、吐司還是饅頭？"),
+    ("jam_toast", ["size"], "要厚片還是薄片呢？"),
+    ("snack", ["snack"], "請問要補充什麼？"),
+    ("riceball", [], "請問還需要什麼嗎？"),
+])
+def test_clarify_message_fallbacks(dm_session, rtype, missing, expected):
+    assert dm_session["dm"].get_clarify_message(rtype, missing) == expected
+
+def test_incomplete_frames_between_complete_ones_keep_order(dm_session):
+    """完整品項夾著未完成品項時：完整的依序入車，未完成的依原順序留在佇列"""
+    dm = dm_session["dm"]
+    session_id = dm_session["session_id"]
+
+    response = dm.handle(session_id, "我要大冰奶跟一杯豆漿跟一份薯餅跟一個鮪魚蛋")
+    # 第一個未完成品項（豆漿）決定追問
+    assert response == "你要冰的、溫的？"
+
+    session = dm.store.get(session_id)
+    assert [i["itemtype"] for i in session["cart"]] == ["drink", "snack"]
+    assert session["cart"][0]["drink"] == "純鮮奶茶"
+    assert [f["itemtype"] for f in session["pending_frames"]] == ["drink", "carrier"]
+
+    response = dm.handle(session_id, "大杯冰的")
+    assert "你要漢堡、吐司還是饅頭？" in response
+    assert [f["itemtype"] for f in dm.store.get(session_id)["pending_frames"]] == ["carrier"]
+
+
+def test_session_store_concurrent_first_get_shares_one_session():
+    import threading
+    from src.dm.session_store import InMemorySessionStore
+
+    store = InMemorySessionStore()
+    seen, barrier = [], threading.Barrier(8)
+
+    def worker():
+        barrier.wait()
+        seen.append(store.get("s1"))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+
+    assert all(s is seen[0] for s in seen)
+    assert store.lock("s1") is store.lock("s1")
+    assert store.lock("s1") is not store.lock("s2")
+
+def test_session_store_drops_unreferenced_locks():
+    import gc
+    from src.dm.session_store import InMemorySessionStore
+
+    store = InMemorySessionStore()
+    for i in range(100):
+        with store.lock(f"s{i}"):
+            pass
+    held = store.lock("kept")
+    gc.collect()
+
+    assert list(store._locks) == ["kept"]
+    assert store.lock("kept") is held
@@ -134,4 +134,28 @@ def test_price_injection_blocked_after_remove(dm_session):
     
     response = dm.handle(sid, "結帳")
     assert "20元" in response # Remaining hot dog is 20
-    assert "5元" not in response
\ No newline at end of file
+    assert "5元" not in response
+
+
+def test_cancel_combo_sub_item_keeps_other_pending_frames(dm_session):
+    """
+    取消套餐子品項時，只剔除同套餐的子品項，其他待補品項保留且順序不變
+    """
+    from collections import deque
+    dm = dm_session["dm"]
+    sid = dm_session["session_id"]
+
+    session = dm.store.get(sid)
+    dm._ensure_session_defaults(session)
+    session["current_combo_frame"] = {"combo_name": "套餐二", "sub_items": []}
+    session["pending_frames"] = deque([
+        {"itemtype": "riceball", "flavor": "鮪魚", "_is_combo_sub_item": True, "missing_slots": ["rice"]},
+        {"itemtype": "drink", "drink": "奶茶", "missing_slots": ["temp"]},
+        {"itemtype": "drink", "drink": "豆漿", "_is_combo_sub_item": True, "missing_slots": ["temp"]},
+        {"itemtype": "riceball", "flavor": "肉鬆", "missing_slots": ["rice"]},
+    ])
+
+    response = dm.handle(sid, "取消")
+    assert "已取消剛剛的變更" in response
+    assert "current_combo_frame" not in session
+    assert [f.get("drink") or f.get("flavor") for f in session["pending_frames"]] == ["奶茶", "肉鬆"]
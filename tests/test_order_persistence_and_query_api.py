@@ -38,6 +38,9 @@ def test_env():
     api_mod.order_repo = old_repos["api"]
     dm_mod.order_repo = old_repos["dm"]
     
+    # 關閉長連線後才能刪檔
+    test_repo.close()
+    
     # 清理檔案 (retry Windows 鎖定)
     for _ in range(10):
         try:
@@ -102,3 +105,31 @@ def test_api_list_orders_filtering(client, test_env):
     response = client.get("/orders", headers={"X-API-Key": "yuan-secret-key"})
     assert response.status_code == 200
     assert len(response.json()["items"]) == 2
+
+def test_save_orders_batch(test_env):
+    payloads = [
+        ({"order_id": f"ORD-{i}", "status": "SUBMITTED", "created_at": f"2026-01-0{i}T08:00:00", "items": [], "total_price": 10 * i}, f"s{i}")
+        for i in range(1, 4)
+    ]
+    test_env.save_orders_batch(payloads)
+
+    orders = test_env.list_orders()
+    assert [o["order_id"] for o in orders] == ["ORD-3", "ORD-2", "ORD-1"]
+    assert test_env.get_order("ORD-2")["total_price"] == 20
+
+def test_list_orders_date_filter_uses_index(test_env):
+    payloads = [
+        ({"order_id": oid, "status": "SUBMITTED", "created_at": ts, "items": [], "total_price": 0}, "s")
+        for oid, ts in [("ORD-A", "2026-01-01T23:59:59"), ("ORD-B", "2026-01-02T00:00:00"), ("ORD-C", "2026-01-10T08:00:00")]
+    ]
+    test_env.save_orders_batch(payloads)
+
+    assert [o["order_id"] for o in test_env.list_orders(date="2026-01-01")] == ["ORD-A"]
+    assert [o["order_id"] for o in test_env.list_orders(date="2026-01")] == ["ORD-C", "ORD-B", "ORD-A"]
+
+    # 用 list_orders 實際組出的查詢檢查執行計畫
+    query, params = test_env._build_list_query("2026-01-01", None, 50, 0)
+    with test_env._lock:
+        plan = test_env._get_connection().execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+    # SEARCH 表示索引範圍查找；退回 LIKE 時只會是 SCAN
+    assert any(row[-1].startswith("SEARCH") and "idx_orders_created_status" in row[-1] for row in plan)
@@ -91,3 +91,15 @@ def test_get_raw_menu_loading_error(monkeypatch):
         menu_price_service.get_raw_menu()
         
     assert "Failed to load or parse base menu file" in str(excinfo.value)
+
+def test_get_menu_by_category_matches_raw_menu():
+    """
+    Tests that the category index groups every raw menu item under its category.
+    """
+    # Act
+    by_category = menu_price_service.get_menu_by_category()
+    raw_menu = menu_price_service.get_raw_menu()
+
+    # Assert
+    assert {"name": "起司蛋餅", "price": 40} in by_category["蛋餅"]
+    assert sum(len(items) for items in by_category.values()) == sum(1 for i in raw_menu if i.get("category"))